@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Measure the save of a composite with its stages validated by 1 and by several threads (MapperComposite Meta.workers)
+on a generated kassir-style feed, against a SQLite database answering every query after a simulated network latency.
+
+The form cleaning holds the GIL, so the threads only gain on the time the validation waits on the database:
+with --latency 0 they are slower than a single thread.
+
+Usage: python -m benchmarks.composite [--size 2000] [--workers 2] [--latency 0.0005] [--repeat N]
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.pipeline import setup_django, reset_database
+
+
+def add_latency(latency):
+    """
+    Delay every query of the connections opened from now on, including the ones of the validating threads.
+    """
+    from django.db.backends.signals import connection_created
+
+    def delay(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def on_connection_created(sender, connection, **kwargs):
+        if delay not in connection.execute_wrappers:
+            connection.execute_wrappers.append(delay)
+
+    connection_created.connect(on_connection_created, weak=False)
+
+
+def measure(payload, workers, repeat=1):
+    """
+    :returns: the best time of the save of the composite on an empty database, in seconds.
+    """
+    from kudago_mapper.mappers import MapperComposite
+    from tests.mappers import ParallelKassirMapperComposite
+
+    class Composite(MapperComposite):
+        class Meta:
+            mappers = ParallelKassirMapperComposite.Meta.mappers
+
+    Composite.Meta.workers = workers
+    results = []
+    for _ in range(repeat):
+        reset_database()
+        composite = Composite(payload)
+        start = time.perf_counter()
+        composite.save(bulk=True)
+        results.append(time.perf_counter() - start)
+    return min(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=2000, help='number of feed items')
+    parser.add_argument('--workers', type=int, default=2, help='threads of the concurrent runs')
+    parser.add_argument('--latency', type=float, default=0.0005, help='seconds added to every query')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per number of threads, the best one is reported')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='kudago_mapper_benchmark')
+    try:
+        setup_django(directory)
+        from benchmarks.feeds import generate_feed
+
+        if args.latency:
+            add_latency(args.latency)
+        payload = generate_feed(args.size)
+        baseline = measure(payload, 1, args.repeat)
+        print('{} items, {:.2f} ms per query'.format(args.size, args.latency * 1000))
+        print('  {:>2} workers {:>9.3f} s'.format(1, baseline))
+        seconds = measure(payload, args.workers, args.repeat)
+        print('  {:>2} workers {:>9.3f} s {:>8.2f}x'.format(args.workers, seconds, baseline / seconds))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+"""
+Measure the per-instance cost of constructing mappers on small payloads.
+
+Usage: python -m benchmarks.construction [number]
+"""
+import os
+import sys
+import timeit
+
+import django
+
+
+PAYLOAD = '''<?xml version="1.0" encoding="utf-8"?>
+<root>
+  <item id="310712" type="hall">
+    <id>310712</id>
+    <type>hall</type>
+    <name>Hall</name>
+    <originalUrl>https://spb.kassir.ru/kassir/hall/view/310712</originalUrl>
+  </item>
+</root>'''
+
+
+def main(number=2000):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.test_settings')
+    django.setup()
+
+    from tests.mappers import HallRSSMapper, EventTransfMultipleRSSMapper
+
+    for mapper in (HallRSSMapper, EventTransfMultipleRSSMapper):
+        mapper(PAYLOAD)
+        seconds = timeit.timeit(lambda: mapper(PAYLOAD), number=number)
+        print('{:<32} {:>8.1f} us per instance'.format(mapper.__name__, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
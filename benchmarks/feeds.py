@@ -0,0 +1,78 @@
+"""
+Synthetic kassir-style feeds for the benchmarks.
+"""
+import random
+
+
+HALL = '''  <item id="{id}" type="hall">
+    <id>{id}</id>
+    <type>hall</type>
+    <name>Hall {id}</name>
+    <originalUrl>https://spb.kassir.ru/kassir/hall/view/{id}</originalUrl>
+  </item>
+'''
+
+ACTION = '''  <item id="{id}" type="action">
+    <id>{id}</id>
+    <type>action</type>
+    <name>Action {id}</name>
+    <category>Фестивали</category>
+    <category>Музыкальные фестивали</category>
+    <originalUrl>https://spb.kassir.ru/kassir/action/view/{id}</originalUrl>
+    <description>{description}</description>
+  </item>
+'''
+
+ARTIST = '''  <item id="{id}" type="artist">
+    <id>{id}</id>
+    <type>artist</type>
+    <action>{actions}</action>
+    <name>Artist {id}</name>
+  </item>
+'''
+
+EVENT = '''  <item id="{id}" type="event">
+    <id>{id}</id>
+    <type>event</type>
+    <action>{action}</action>
+    <hall_id>{hall}</hall_id>
+    <name>Event {id}</name>
+    <category>Фестивали</category>
+    <price_min>{price_min}</price_min>
+    <price_max>{price_max}</price_max>
+    <originalUrl>https://spb.kassir.ru/kassir/event/view/{id}</originalUrl>
+    <date>2017-09-{day:02d} 13:00</date>
+    <end_date>2017-09-{day:02d} 20:00</end_date>
+    <description>{description}</description>
+  </item>
+'''
+
+DESCRIPTION = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4
+
+
+def generate_feed(size, seed=0):
+    """
+    Generate a feed of `size` items mixing halls, actions, artists and events like the kassir.ru export.
+    Halls and actions come first, so that the other items only reference existing ones.
+    :returns: the feed as a string.
+    """
+    rnd = random.Random(seed)
+    halls = max(1, size // 20)
+    actions = max(1, size // 10)
+    artists = max(1, size // 5)
+    events = max(0, size - halls - actions - artists)
+    hall_ids = range(1, halls + 1)
+    action_ids = range(100001, 100001 + actions)
+
+    parts = ['<?xml version="1.0" encoding="utf-8"?>\n<root>\n']
+    parts.extend(HALL.format(id=i) for i in hall_ids)
+    parts.extend(ACTION.format(id=i, description=DESCRIPTION) for i in action_ids)
+    parts.extend(ARTIST.format(id=1000001 + i, actions=', '.join(str(a) for a in rnd.sample(action_ids, 2)))
+                 for i in range(artists))
+    for i in range(events):
+        price_min = rnd.randrange(100, 1000)
+        parts.append(EVENT.format(id=2000001 + i, action=rnd.choice(action_ids), hall=rnd.choice(hall_ids),
+                                  price_min=price_min, price_max=price_min + rnd.randrange(0, 2000),
+                                  day=rnd.randrange(1, 29), description=DESCRIPTION))
+    parts.append('</root>\n')
+    return ''.join(parts)
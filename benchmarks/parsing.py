@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+"""
+Compare the original XmlListConfig parsing with parse_xml on a generated feed.
+
+Usage: python -m benchmarks.parsing [size]
+"""
+import gc
+import sys
+import time
+from xml.etree import ElementTree
+
+from kudago_mapper.parsers import XmlListConfig, parse_xml, lxml_etree, _fast_list
+
+from .feeds import generate_feed
+
+
+def measure(name, func, *args):
+    gc.collect()
+    start = time.perf_counter()
+    result = func(*args)
+    print('{:<44} {:>8.3f} s'.format(name, time.perf_counter() - start))
+    return result
+
+
+def main(size=100000):
+    payload = generate_feed(size).encode('utf-8')
+    print('{} items, {:.1f} MB'.format(size, len(payload) / 2 ** 20))
+
+    root = measure('ElementTree.fromstring', ElementTree.fromstring, payload)
+    expected = measure('  XmlListConfig conversion', XmlListConfig, root)
+    assert measure('  optimized conversion', _fast_list, root) == expected
+    del root
+
+    measure('XmlListConfig(ElementTree.fromstring) total', lambda: XmlListConfig(ElementTree.fromstring(payload)))
+    assert measure('parse_xml with ElementTree total', parse_xml, payload, False) == expected
+    if lxml_etree is not None:
+        assert measure('parse_xml with lxml total', parse_xml, payload, True) == expected
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Measure the throughput and the peak memory of the mapping pipeline on generated kassir-style feeds,
+saved with KassirMapperComposite into a SQLite database.
+
+Stages:
+    - parse: parse_xml of the whole feed
+    - load: construction of the composite, parsing the feed once and routing the items to the mappers
+    - validate: building and validating the forms of all the mappers, stage by stage of the composite
+    - save: bulk save of the validated forms, broken down into the mapper stats stages with --stats
+
+Usage: python -m benchmarks.pipeline [--sizes 1000 10000 ...] [--repeat N] [--no-memory] [--stats]
+                                     [--output results.json] [--baseline results.json [--tolerance 0.2]]
+
+With --baseline, the run fails if a stage got slower or took more memory than the baseline by more than the tolerance.
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+
+
+STAGES = ('parse', 'load', 'validate', 'save')
+
+
+def setup_django(directory):
+    settings.configure(
+        SECRET_KEY='benchmark',
+        INSTALLED_APPS=['tests'],
+        DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(directory, 'db.sqlite3')}},
+        KUDAGO_MAPPER_MAX_ITEMS=sys.maxsize,
+    )
+    django.setup()
+
+
+def reset_database():
+    from django.core.management import call_command
+    from django.db import connections
+
+    connections.close_all()
+    name = settings.DATABASES['default']['NAME']
+    if os.path.exists(name):
+        os.remove(name)
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+def run_stages(payload):
+    """
+    Run the stages once, yielding the name of each stage before it starts and its result after.
+    The mappers of a composite stage rely on the objects saved by the previous ones, so the validate and save stages
+    alternate for each of them.
+    """
+    from kudago_mapper.parsers import parse_xml
+    from tests.mappers import KassirMapperComposite
+
+    yield 'parse'
+    yield parse_xml(payload)
+    yield 'load'
+    composite = KassirMapperComposite(payload)
+    yield composite
+    for stage in composite.stages:
+        yield 'validate'
+        composite.validate(stage)
+        for mapper in stage:
+            # without Meta.workers the composite leaves the mappers to validate lazily while saving
+            if mapper._forms is None:
+                mapper.validate()
+        yield composite
+        yield 'save'
+        for mapper in stage:
+            mapper.save(bulk=True)
+        yield composite
+
+
+def measure(payload, memory):
+    """
+    Run the stages on an empty database, measuring either their time or their peak memory.
+    :returns: mapping from the stages to seconds or bytes, summed or the highest ones for the repeated stages.
+    """
+    results = {}
+    reset_database()
+    stages = run_stages(payload)
+    for stage in stages:
+        gc.collect()
+        if memory:
+            tracemalloc.start()
+            result = next(stages)
+            results[stage] = max(results.get(stage, 0), tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            result = next(stages)
+            results[stage] = results.get(stage, 0) + time.perf_counter() - start
+        del result
+    return results
+
+
+def run(size, repeat=1, memory=True, stats=False):
+    """
+    Benchmark the pipeline on a generated feed of the given size.
+    :returns: a report of the measurements, see `print_report`.
+    """
+    from benchmarks.feeds import generate_feed
+    from tests.models import EventThrough
+
+    payload = generate_feed(size)
+    report = {'items': size, 'bytes': len(payload.encode('utf-8'))}
+
+    runs = [measure(payload, memory=False) for _ in range(repeat)]
+    report['seconds'] = {stage: min(result[stage] for result in runs) for stage in STAGES}
+    report['throughput'] = {stage: size / seconds for stage, seconds in report['seconds'].items()}
+    report['saved_events'] = EventThrough.objects.count()
+    if memory:
+        report['peak_memory'] = measure(payload, memory=True)
+    if stats:
+        # in a separate run, so that the instrumentation doesn't weigh on the measurements above
+        from django.test.utils import override_settings
+        from tests.mappers import KassirMapperComposite
+
+        reset_database()
+        with override_settings(KUDAGO_MAPPER_STATS=True):
+            composite = KassirMapperComposite(payload)
+            composite.save(bulk=True)
+        merged = composite.get_stats()
+        report['stats'] = {'timings': dict(merged.timings), 'counters': dict(merged.counters),
+                           'queries': merged.queries}
+    return report
+
+
+def print_report(report):
+    print('{items} items, {size:.1f} MB, {events} events saved'.format(
+        items=report['items'], size=report['bytes'] / 2 ** 20, events=report['saved_events']))
+    for stage in STAGES:
+        line = '  {:<8} {:>9.3f} s {:>12.0f} items/s'.format(
+            stage, report['seconds'][stage], report['throughput'][stage])
+        if 'peak_memory' in report:
+            line += ' {:>10.1f} MB peak'.format(report['peak_memory'][stage] / 2 ** 20)
+        print(line)
+    if 'stats' in report:
+        stats = report['stats']
+        print('  save breakdown: ' + ', '.join('{} {:.3f} s'.format(stage, seconds)
+                                               for stage, seconds in stats['timings'].items() if seconds))
+        print('  {} queries, counters: {}'.format(stats['queries'], stats['counters']))
+
+
+def compare(reports, baseline, tolerance):
+    """
+    :returns: descriptions of the measurements worse than the baseline by more than the tolerance.
+    """
+    regressions = []
+    for size, report in reports.items():
+        base = baseline.get(size)
+        if base is None:
+            continue
+        for key in ('seconds', 'peak_memory'):
+            for stage, value in report.get(key, {}).items():
+                base_value = base.get(key, {}).get(stage)
+                if base_value and value > base_value * (1 + tolerance):
+                    regressions.append('{} items, {} {}: {:.4g} against {:.4g}'.format(
+                        size, stage, key, value, base_value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000], help='numbers of feed items')
+    parser.add_argument('--repeat', type=int, default=1, help='time runs per size, the best one is reported')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='skip the peak memory run')
+    parser.add_argument('--stats', action='store_true', help='break the save stage down with the mapper stats')
+    parser.add_argument('--output', help='file to write the results to as json')
+    parser.add_argument('--baseline', help='json results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown (default 0.2)')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='kudago_mapper_benchmark')
+    try:
+        setup_django(directory)
+        reports = {}
+        for size in args.sizes:
+            reports[str(size)] = report = run(size, args.repeat, args.memory, args.stats)
+            print_report(report)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(reports, json.load(f), args.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import asyncio
+import inspect
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.request import urlopen
+
+from django.db import connections
+
+
+DEFAULT_TIMEOUT = 60
+DEFAULT_CONCURRENCY = 8
+
+
+def fetch_url(url, timeout=DEFAULT_TIMEOUT):
+    """
+    Download a payload with urllib, blocking.
+    """
+    with urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+
+async def fetch_source(source):
+    """
+    The default fetcher: download a url in a thread, or read a reader, awaiting its `read` if it is a coroutine
+    (e.g. asyncio.StreamReader) and running it in a thread otherwise.
+    A fetcher is any coroutine function taking a source and returning the payload.
+    """
+    if hasattr(source, 'read'):
+        if inspect.iscoroutinefunction(source.read):
+            return await source.read()
+        return await run_in_thread(source.read)
+    return await run_in_thread(fetch_url, source)
+
+
+def _call_and_close(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # the connections of the thread aren't reused by the coroutines
+        connections.close_all()
+
+
+async def run_in_thread(func, *args, executor=None, **kwargs):
+    """
+    Run a blocking function in an executor, the default one if None, closing the connections it opened.
+    """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, partial(_call_and_close, func, *args, **kwargs))
+
+
+async def load_source(mapper_class, source, fetcher=None):
+    """
+    Fetch a source and build a mapper or a composite from the payload, parsing it in a thread.
+    """
+    payload = await (fetcher or fetch_source)(source)
+    return await run_in_thread(mapper_class, payload)
+
+
+async def amap_sources(mapper_class, sources, concurrency=DEFAULT_CONCURRENCY, fetcher=None,
+                       return_exceptions=False, **save_kwargs):
+    """
+    Fetch, parse, validate and save many sources with a mapper or a composite class, overlapping the sources.
+    At most `concurrency` sources are processed at once. Fetching, parsing and validation run concurrently,
+    while all the database writes go through a single thread, one source at a time.
+    :param sources: urls or readers, see `fetch_source`.
+    :param fetcher: coroutine function taking a source and returning the payload, defaults to `fetch_source`.
+    :param return_exceptions: if True, the exception of a failed source is returned in place of its result,
+    otherwise the first one is raised.
+    :param save_kwargs: arguments of `save`.
+    :returns: the results of `save` in the order of the sources.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    writer = ThreadPoolExecutor(max_workers=1)
+
+    async def process(source):
+        async with semaphore:
+            mapper = await mapper_class.afrom_source(source, fetcher=fetcher)
+            return await mapper.asave(writer=writer, **save_kwargs)
+
+    tasks = [asyncio.ensure_future(process(source)) for source in sources]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    finally:
+        writer.shutdown(wait=True)
@@ -0,0 +1,122 @@
+import hashlib
+import mmap
+import os
+import pickle
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+DEFAULT_MAX_SIZE = 2 ** 30
+
+
+def describe_parser_key(key):
+    """
+    Stable description of a parser key (see `Mapper.get_parser_key`) across the processes.
+    """
+    if isinstance(key, tuple):
+        return '({})'.format(','.join(describe_parser_key(part) for part in key))
+    if hasattr(key, '__qualname__'):
+        return '{}.{}'.format(key.__module__, key.__qualname__)
+    return repr(key)
+
+
+class ParseCache(object):
+    """
+    Cache of the items parsed from payloads on disk, see Mapper Meta.parse_cache.
+    An entry is keyed by the digest of the payload and the parser key, it holds the pickled list of the items
+    and is read through a memory map. Once the entries take more than `max_size` bytes, the least recently used
+    ones are removed.
+    :param directory: directory of the entries, created if missing.
+    :param max_size: maximum total size of the entries in bytes.
+    """
+    suffix = '.pickle'
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def get_key(self, payload, parser_key):
+        """
+        :param payload: the raw data, a string or bytes.
+        """
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        digest = hashlib.sha256(payload)
+        digest.update(describe_parser_key(parser_key).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """
+        :returns: the cached items, or None if there is no entry.
+        """
+        path = self._get_path(key)
+        try:
+            with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                items = pickle.loads(data)
+        except (FileNotFoundError, ValueError):
+            # ValueError for an empty file, which can't be mapped
+            return None
+        try:
+            # marking the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return items
+
+    def set(self, key, items):
+        path = self._get_path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        # replacing the entry at once, so that the concurrent readers never see a partial one
+        temp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+        with open(temp_path, 'wb') as f:
+            pickle.dump(items, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the least recently used entries until they fit into `max_size`.
+        """
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.suffix):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(self.suffix):
+                    os.remove(entry.path)
+
+
+def get_parse_cache(meta):
+    """
+    Find the cache of the parsed items: Meta.parse_cache, then the KUDAGO_MAPPER_PARSE_CACHE setting,
+    either a ParseCache or its dotted path.
+    """
+    cache = getattr(meta, 'parse_cache', getattr(settings, 'KUDAGO_MAPPER_PARSE_CACHE', None))
+    if isinstance(cache, str):
+        cache = import_string(cache)
+    return cache
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+
+from django.conf import settings
+from django.db import router, transaction
+from django.utils.module_loading import import_string
+
+
+def item_hash(item):
+    """
+    Digest of the mapped fields of an item, independent of their order.
+    """
+    dump = json.dumps(item, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(dump.encode('utf-8')).hexdigest()
+
+
+class HashStore(object):
+    """
+    Abstract base class for the stores of the item hashes of the previous imports, see Mapper Meta.hash_store.
+    The hashes are kept per namespace (one per mapper class) and keyed by the lookup values of the items as strings.
+    Subclasses should implement `get_many`, `set_many` and `clear` methods.
+    """
+    def get_many(self, namespace, keys):
+        """
+        :returns: mapping from the keys known to the store to their hashes.
+        """
+        raise NotImplementedError("You should subclass HashStore and implement the get_many method.")
+
+    def set_many(self, namespace, hashes):
+        """
+        Store the hashes of the given keys, replacing the previous ones.
+        :param hashes: mapping from the keys to their hashes.
+        """
+        raise NotImplementedError("You should subclass HashStore and implement the set_many method.")
+
+    def clear(self, namespace):
+        """
+        Forget all the hashes of a namespace, so that all its items are imported again.
+        """
+        raise NotImplementedError("You should subclass HashStore and implement the clear method.")
+
+
+class ModelHashStore(HashStore):
+    """
+    Store of the hashes in a database table.
+    :param model: model with `namespace`, `key` and `digest` character fields, the first two unique together.
+    """
+    def __init__(self, model, batch_size=500):
+        self.model = model
+        self.batch_size = batch_size
+
+    def get_many(self, namespace, keys):
+        manager = self.model._default_manager
+        keys = list(keys)
+        hashes = {}
+        for offset in range(0, len(keys), self.batch_size):
+            hashes.update(manager.filter(namespace=namespace, key__in=keys[offset:offset + self.batch_size])
+                          .values_list('key', 'digest'))
+        return hashes
+
+    def set_many(self, namespace, hashes):
+        db = router.db_for_write(self.model)
+        manager = self.model._default_manager.db_manager(db)
+        keys = list(hashes)
+        with transaction.atomic(using=db):
+            for offset in range(0, len(keys), self.batch_size):
+                manager.filter(namespace=namespace, key__in=keys[offset:offset + self.batch_size]).delete()
+            manager.bulk_create([self.model(namespace=namespace, key=key, digest=digest)
+                                 for key, digest in hashes.items()], batch_size=self.batch_size)
+
+    def clear(self, namespace):
+        self.model._default_manager.filter(namespace=namespace).delete()
+
+
+class FileHashStore(HashStore):
+    """
+    Store of the hashes in local json files, one per namespace.
+    The file of a namespace is read once and rewritten as a whole on every `set_many`.
+    :param directory: directory of the files, created if missing.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _get_path(self, namespace):
+        return os.path.join(self.directory, '{}.json'.format(namespace))
+
+    def _load(self, namespace):
+        if namespace not in self._hashes:
+            try:
+                with open(self._get_path(namespace), encoding='utf-8') as f:
+                    self._hashes[namespace] = json.load(f)
+            except FileNotFoundError:
+                self._hashes[namespace] = {}
+        return self._hashes[namespace]
+
+    def get_many(self, namespace, keys):
+        with self._lock:
+            hashes = self._load(namespace)
+            return {key: hashes[key] for key in keys if key in hashes}
+
+    def set_many(self, namespace, hashes):
+        with self._lock:
+            stored = self._load(namespace)
+            stored.update(hashes)
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._get_path(namespace)
+            # replacing the file at once, so that an interrupted write doesn't lose the previous hashes
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(stored, f)
+            os.replace(path + '.tmp', path)
+
+    def clear(self, namespace):
+        with self._lock:
+            self._hashes.pop(namespace, None)
+            try:
+                os.remove(self._get_path(namespace))
+            except FileNotFoundError:
+                pass
+
+
+def get_hash_store(meta):
+    """
+    Find the store of the item hashes: Meta.hash_store, then the KUDAGO_MAPPER_HASH_STORE setting,
+    either a HashStore or its dotted path.
+    """
+    store = getattr(meta, 'hash_store', getattr(settings, 'KUDAGO_MAPPER_HASH_STORE', None))
+    if isinstance(store, str):
+        store = import_string(store)
+    return store
@@ -1,15 +1,98 @@
-from xml.etree import ElementTree
+import io
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial, wraps
+from itertools import chain, islice
+from time import perf_counter
 
+import django
 import six
-from django.forms import modelformset_factory, BaseModelFormSet
+from django.apps import apps
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.forms import modelform_factory
+from django.forms.utils import ErrorDict
 from django.conf import settings
+from django.db import connections, router, transaction
 
-from kudago_mapper.parsers import XmlListConfig
-from kudago_mapper.utils import DeclarativeMapperMetaclass, M2MThroughSavingModelForm
+from kudago_mapper.parsers import iter_xml_items, parse_xml, iter_json_items, iter_json_lines, iter_csv_items
+from kudago_mapper.utils import (DeclarativeMapperMetaclass, M2MThroughSavingModelForm, iter_batches, iter_submitted,
+                                 get_related_fields, prefetch_related_fields, m2m_requires_pk, get_dependency_stages,
+                                 get_column_fields, convert_columns, clean_field)
 from kudago_mapper.fields import Field
+from kudago_mapper.aio import load_source, run_in_thread
+from kudago_mapper.stats import MapperStats, get_stats_hook
+from kudago_mapper.hashes import item_hash, get_hash_store
+from kudago_mapper.cache import get_parse_cache
 
 
 DEFAULT_MAX_ITEMS = 2000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CACHE_SIZE = 1024
+
+SyncResult = namedtuple('SyncResult', ('created', 'updated', 'unchanged', 'missing'))
+# an error of an invalid item: its index among the items of the mapper, its Meta.lookup_field (or ext_id) value,
+# the name of the field or None for the errors of the whole item, and the message
+ItemError = namedtuple('ItemError', ('index', 'key', 'field', 'message'))
+FieldCacheStats = namedtuple('FieldCacheStats', ('hits', 'misses', 'maxsize', 'currsize', 'hit_rate'))
+
+
+class _NoTimer(object):
+    # the stage timer of the mappers without stats
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_timer = _NoTimer()
+
+
+def _instrumented(emit=True):
+    # measure a call of a mapper method and count its queries, then emit the stats if `emit`
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+            db = router.db_for_write(self.model)
+            with stats.timer('total'), connections[db].execute_wrapper(stats.query_counter):
+                result = method(self, *args, **kwargs)
+            if emit and self.stats_hook is not None:
+                self.stats_hook(stats)
+            return result
+        return wrapper
+    return decorator
+
+
+class InvalidItemsError(ValueError):
+    """
+    Raised by `Mapper.save` with raise_invalid if some of the items are invalid.
+    :param errors: list of ItemError.
+    :param complete: False if the validation stopped at the maximum number of invalid items.
+    """
+    max_reported = 10
+
+    def __init__(self, errors, complete=True):
+        self.errors = errors
+        self.complete = complete
+        report = '; '.join('item {} ({}) {}: {}'.format(error.index, error.key, error.field or 'item', error.message)
+                           for error in errors[:self.max_reported])
+        if len(errors) > self.max_reported:
+            report += '; and {} more'.format(len(errors) - self.max_reported)
+        super(InvalidItemsError, self).__init__('{} errors were found{}: {}'.format(
+            len(errors), '' if complete else ' before the validation stopped', report))
+
+
+def _init_worker():
+    # the spawned workers start with a fresh interpreter
+    if not apps.ready:
+        django.setup()
+
+
+def _clean_in_worker(mapper_class, items):
+    return mapper_class.get_form_class().clean_in_worker(items)
 
 
 @six.add_metaclass(DeclarativeMapperMetaclass)
@@ -22,92 +105,920 @@ class Mapper(object):
         - model: model corresponding to the mapper (required)
         - fields: model fields to be parsed (required)
         - field_map: mapping from the mapper field names to the model field names
+        - max_items: maximum number of items to be processed
+        - batch_size: number of objects written per query by the bulk save
+        - lookup_field: unique model field identifying the objects across imports, required by `sync`
+        - ignore_m2m_conflicts: if True, the bulk save ignores links already present in custom through tables
+        - convert_columns: if True, the plain integer, decimal and datetime fields are cleaned for a batch of items
+        at once, column by column, instead of by every form
+        - cache_fields: names of the fields whose cleaned values are memoized per raw value, for the deterministic
+        fields applied to many repeated values (dates, prices, categories); see `get_cache_stats`
+        - cache_size: maximum number of values memoized per field, least recently used ones are dropped first
+        - stats: if True, the mapper measures its work in a MapperStats object available as `mapper.stats`,
+        defaults to the KUDAGO_MAPPER_STATS setting
+        - stats_hook: a callable (or its dotted path) given the stats after every `save`, `save_chunked` and `sync`,
+        e.g. `kudago_mapper.stats.log_stats`; defaults to the KUDAGO_MAPPER_STATS_HOOK setting and turns the stats on
+        - discriminator: a pair (key, check) selecting the parsed items which belong to the mapper before any
+        validation; if check is a callable, it is called with the item value of the key and should return a boolean,
+        otherwise the value is checked on equality with it
+        - processes: number of worker processes the batches of items are sharded across, defaults to
+        the KUDAGO_MAPPER_PROCESSES setting or 1, cleaning in the current process. The workers clean the fields
+        which don't reference other models and apply the leading transforms taking only such fields, the rest
+        of the validation and the save stay in the current process. Worth it for large feeds with expensive
+        fields; the mapper class must be importable by the workers, and the cache_fields and column conversion
+        don't apply to the fields cleaned by them
+        - hash_store: a HashStore (or its dotted path) remembering a hash of the mapped fields of every item saved,
+        by its Meta.lookup_field value (ext_id by default); the items unchanged since they were saved are skipped
+        before any validation. Defaults to the KUDAGO_MAPPER_HASH_STORE setting. The hashes are stored once
+        the transaction saving the items commits; they don't cover the code of the mapper, so the store has to be
+        cleared when the mapping changes, see `HashStore.clear`
+        - max_errors: number of invalid items `save` with raise_invalid stops the validation at,
+        defaults to the KUDAGO_MAPPER_MAX_ERRORS setting or None, validating all the items. Only that many items
+        are reported, but the items cleaned ahead a batch at a time (transforms, Meta.processes) are validated
+        up to the end of their batches, so the work saved by the limit is approximate
+        - parse_cache: a ParseCache (or its dotted path) keeping the items parsed from the payloads of
+        `payload_types` on disk, so that the mappers parsing the same payload the same way don't parse it again.
+        Defaults to the KUDAGO_MAPPER_PARSE_CACHE setting. The items are read as a whole and, to be shared by
+        all the mappers of a parser, aren't projected on the source keys
 
     Any fields declared on the class will be added to the model fields.
     """
-    def __init__(self, data):
+    # types of the raw data holding the payload itself, rather than e.g. a path to it
+    payload_types = (str, bytes)
+
+    def __init__(self, data, parsed=False, source_keys=None):
+        """
+        :param data: raw data to be parsed with `parse_data`.
+        :param parsed: if True, data is taken as already parsed items.
+        :param source_keys: keys of the items to be parsed, defaults to the ones used by the mapper.
+        """
         if not hasattr(self, 'Meta') or not hasattr(self.Meta, 'model'):
             raise ValueError('No model is specified for {}.'.format(self.__class__.__name__))
         self.model = self.Meta.model
         self.fields = self.Meta.fields
         self.field_map = getattr(self.Meta, 'field_map', {})
+        self.max_items = getattr(self.Meta, 'max_items',
+                                 getattr(settings, 'KUDAGO_MAPPER_MAX_ITEMS', DEFAULT_MAX_ITEMS))
 
-        transforms = self.declared_transforms
+        self.stats_hook = get_stats_hook(self.Meta)
+        if self.stats_hook is not None or getattr(self.Meta, 'stats', getattr(settings, 'KUDAGO_MAPPER_STATS', False)):
+            self.stats = MapperStats(self.__class__.__name__)
+        else:
+            self.stats = None
 
-        declared_fields = self.declared_fields
+        self.hash_store = get_hash_store(self.Meta)
+        # identifies the items in the hash store and the error reports
+        self.key_field = getattr(self.Meta, 'lookup_field', 'ext_id')
+        # hashes of the items let through, then of the ones saved, by their keys
+        self._item_hashes = {}
+        self._saved_hashes = {}
+        self._skipped_keys = []
+        # off for the items shared by a composite, which counts them once
+        self._count_parsed = True
+
+        self.form_class = self.get_form_class()
+        self._field_caches = self._build_field_caches()
+        self.source_keys = self.get_source_keys() if source_keys is None else source_keys
+        self.parse_cache = get_parse_cache(self.Meta)
+        if parsed:
+            self.data = data
+        else:
+            with self._timer('parse'):
+                self.data = self._parse(data)
+        self._forms = None
+
+    @classmethod
+    def get_form_class(cls):
+        """
+        Build the model form validating the items of the mapper.
+        The form is built once per mapper class and reused by all its instances.
+        """
+        # looking in the class' own namespace, so that subclasses don't pick up the form of their parent
+        if '_form_class' in cls.__dict__:
+            return cls._form_class
+
+        model = cls.Meta.model
+        declared_fields = cls.declared_fields
+        # (name, transform, argument names or None for all the fields), in the declaration order
+        transforms = [(name, transform, None if transform.fields == '__all__' else tuple(transform.fields))
+                      for name, transform in cls.declared_transforms.items()]
+
+        # the fields transforms can output aren't parsed, so they are allowed into the instance separately
+        output_fields = OrderedDict()
+        for _, transform, _ in transforms:
+            if transform.output_fields is not None:
+                names = transform.output_fields
+            else:
+                names = [f.name for f in model._meta.fields if f.editable and not f.primary_key]
+            for name in names:
+                if name not in declared_fields:
+                    output_fields.setdefault(name, Field())
 
         class MapperModelForm(M2MThroughSavingModelForm):
             def __init__(self, *args, **kwargs):
+                self._related_fields = kwargs.pop('related_fields', None) or {}
+                self._converted = kwargs.pop('converted', None)
+                self._cached_fields = kwargs.pop('cached_fields', None)
+                self._stats = kwargs.pop('stats', None)
+                # (values, errors, number of transforms applied, their outputs) from a worker process
+                self._precleaned = kwargs.pop('precleaned', None)
+                self._transforms_done = self._precleaned[2] if self._precleaned else 0
+                self._transformed = False
+                self._validating_unique = False
                 super(MapperModelForm, self).__init__(*args, **kwargs)
                 self.fields.update(declared_fields)
+                self.fields.update(self._related_fields)
+
+            def full_clean(self):
+                stats = self._stats
+                if stats is None:
+                    return super(MapperModelForm, self).full_clean()
+                with stats.timer('validate'):
+                    super(MapperModelForm, self).full_clean()
+                self._count_validated()
+
+            def _count_validated(self):
+                if self._errors:
+                    self._stats.count('invalid')
+                elif self.cleaned_data:
+                    self._stats.count('valid')
+
+            def _clean_fields(self):
+                converted = self._converted
+                stats = self._stats
+                precleaned = self._precleaned
+                if precleaned:
+                    values, errors, _, _ = precleaned
+                    converted = dict(converted or {})
+                    converted.update(values)
+                    for name, messages in errors.items():
+                        converted[name] = ValidationError([ValidationError(message, code=code)
+                                                           for message, code in messages])
+                if self._cached_fields:
+                    converted = dict(converted or {})
+                    for name, clean in self._cached_fields.items():
+                        field = self.fields.get(name)
+                        if name in converted or field is None or field.disabled:
+                            continue
+                        value = field.widget.value_from_datadict(self.data, self.files, self.add_prefix(name))
+                        start = perf_counter()
+                        try:
+                            converted[name] = clean(value)
+                        except TypeError:
+                            # unhashable values are cleaned by the field
+                            pass
+                        if stats is not None:
+                            stats.add_field_time(name, perf_counter() - start)
+                if not converted and stats is None:
+                    return super(MapperModelForm, self)._clean_fields()
+                # the values cleaned ahead of the form are taken as they are
+                fields = self.fields
+                if converted:
+                    self.fields = OrderedDict((name, field) for name, field in fields.items()
+                                              if name not in converted)
+                try:
+                    if stats is None:
+                        super(MapperModelForm, self)._clean_fields()
+                    else:
+                        # timing the fields one by one
+                        for name, field in list(self.fields.items()):
+                            self.fields = OrderedDict(((name, field),))
+                            start = perf_counter()
+                            super(MapperModelForm, self)._clean_fields()
+                            stats.add_field_time(name, perf_counter() - start)
+                finally:
+                    self.fields = fields
+                for name, value in (converted or {}).items():
+                    if name not in fields:
+                        continue
+                    if isinstance(value, ValidationError):
+                        self.add_error(name, value)
+                    else:
+                        self.cleaned_data[name] = value
+                if precleaned:
+                    if NON_FIELD_ERRORS in converted:
+                        self.add_error(None, converted[NON_FIELD_ERRORS])
+                    self._update_transformed(precleaned[3])
+
+            def _get_validation_exclusions(self):
+                exclude = super(MapperModelForm, self)._get_validation_exclusions()
+                if not self._validating_unique:
+                    # the referenced objects have just been fetched, so the model doesn't need to query them again
+                    exclude.extend(name for name in self._related_fields if name not in exclude)
+                return exclude
+
+            def validate_unique(self):
+                self._validating_unique = True
+                try:
+                    super(MapperModelForm, self).validate_unique()
+                finally:
+                    self._validating_unique = False
+
+            def validate_unique_among(self, seen):
+                """
+                Check the unique values of a valid form against the ones of the forms before it, as a model formset
+                does, since `validate_unique` only checks them against the database. A repeated value invalidates
+                the form, the values of a unique form are added to `seen`, a set shared by the forms.
+                :returns: True if the form is valid and unique.
+                """
+                if not self.is_valid():
+                    return False
+                self._validating_unique = True
+                try:
+                    exclude = self._get_validation_exclusions()
+                finally:
+                    self._validating_unique = False
+                instance = self.instance
+                unique_checks, _ = instance._get_unique_checks(exclude=exclude)
+                rows = []
+                for model_class, unique_check in unique_checks:
+                    row = tuple(getattr(instance, instance._meta.get_field(name).attname) for name in unique_check)
+                    if any(value is None for value in row):
+                        continue
+                    row = (model_class, unique_check, row)
+                    if row in seen:
+                        self.add_error(None, instance.unique_error_message(model_class, unique_check))
+                        return False
+                    rows.append(row)
+                seen.update(rows)
+                return True
 
             def clean(self):
                 cleaned_data = super(MapperModelForm, self).clean()
-                for name, transform in transforms.items():
-                    if transform.fields == '__all__':
+                if self._transformed:
+                    return cleaned_data
+                for name, transform, fields in transforms[self._transforms_done:]:
+                    start = perf_counter()
+                    if fields is None:
                         res = transform(**cleaned_data)
                     else:
-                        res = transform(**{field: cleaned_data[field] for field in transform.fields})
-                    cleaned_data.update(res)
-                    # hack to pass the new fields through checks in construct_instance
-                    self._meta.fields = tuple(set(self._meta.fields + tuple(res)))
-                    self.fields.update({field: Field() for field in res})
+                        res = transform(**{field: cleaned_data[field] for field in fields})
+                    if self._stats is not None:
+                        self._stats.add_transform_time(name, perf_counter() - start)
+                    self._update_transformed(res)
                 return cleaned_data
 
-        class MapperModelFormSet(BaseModelFormSet):
-            def save_new_objects(self, commit=True):
-                self.new_objects = []
-                for form in self.extra_forms:
-                    if not form.has_changed():
-                        continue
-                    if self.can_delete and self._should_delete_form(form):
+            def _update_transformed(self, res):
+                self.cleaned_data.update(res)
+                # let the model validate the new values like the parsed ones
+                for field in res:
+                    if field in output_fields and field not in self.fields:
+                        self.fields[field] = output_fields[field]
+
+            @classmethod
+            def full_clean_batch(cls, forms):
+                """
+                Validate a batch of forms like `full_clean` each, applying every transform to the whole batch at once.
+                """
+                stats = forms[0]._stats if forms else None
+                if stats is not None:
+                    start = perf_counter()
+                pending = []
+                for form in forms:
+                    form._errors = ErrorDict()
+                    form.cleaned_data = {}
+                    if form.empty_permitted and not form.has_changed():
                         continue
+                    form._clean_fields()
+                    pending.append(form)
+                cleaned = pending
+
+                for index, (name, transform, _) in enumerate(transforms):
+                    transform_start = perf_counter()
+                    # the leading transforms may have been applied by worker processes
+                    applied = [form for form in pending if form._transforms_done <= index]
+                    rows = [form.cleaned_data for form in applied]
                     try:
-                        self.new_objects.append(self.save_new(form, commit=commit))
-                    except ValueError:
+                        results = transform.apply_batch(rows)
+                    except ValidationError:
+                        results = []
+                        for row in rows:
+                            try:
+                                results.extend(transform.apply_batch([row]))
+                            except ValidationError as e:
+                                results.append(e)
+                    if stats is not None:
+                        stats.add_transform_time(name, perf_counter() - transform_start)
+                    failed = []
+                    for form, res in zip(applied, results):
+                        if isinstance(res, ValidationError):
+                            # the following transforms aren't applied, as when `clean` raises
+                            form.add_error(None, res)
+                            failed.append(form)
+                        else:
+                            form._update_transformed(res)
+                    if failed:
+                        pending = [form for form in pending if form not in failed]
+
+                for form in cleaned:
+                    form._transformed = True
+                    try:
+                        form._clean_form()
+                    finally:
+                        form._transformed = False
+                    form._post_clean()
+
+                if stats is not None:
+                    stats.add_time('validate', perf_counter() - start)
+                    for form in cleaned:
+                        form._count_validated()
+
+            @classmethod
+            def clean_in_worker(cls, items):
+                """
+                Clean the fields of a batch of items which don't reference other objects and apply the leading
+                transforms taking only such fields, without touching the database, see Meta.processes.
+                :returns: a list with None for an unchanged item or a tuple of the cleaned values,
+                the errors as (message, code) pairs per field, the number of transforms applied and their outputs.
+                """
+                results = []
+                for item in items:
+                    form = cls(item, empty_permitted=True, use_required_attribute=False)
+                    if not form.has_changed():
+                        results.append(None)
                         continue
-                    if not commit:
-                        self.saved_forms.append(form)
-                return self.new_objects
+                    form._errors = ErrorDict()
+                    form.cleaned_data = {}
+                    fields = form.fields
+                    form.fields = OrderedDict((name, field) for name, field in fields.items()
+                                              if name not in cls.related_fields)
+                    try:
+                        form._clean_fields()
+                    finally:
+                        form.fields = fields
+                    values = dict(form.cleaned_data)
+
+                    done = 0
+                    outputs = {}
+                    for _, transform, arguments in transforms[:cls.worker_transforms]:
+                        try:
+                            res = transform(**{argument: form.cleaned_data[argument] for argument in arguments})
+                        except ValidationError as e:
+                            # the following transforms aren't applied, as when `clean` raises
+                            form.add_error(None, e)
+                            done = len(transforms)
+                            break
+                        form.cleaned_data.update(res)
+                        outputs.update(res)
+                        done += 1
+
+                    errors = {name: [(message, error.code) for error in error_list.as_data() for message in error]
+                              for name, error_list in form._errors.items()}
+                    results.append((values, errors, done, outputs))
+                return results
+
+        form_class = modelform_factory(model, form=MapperModelForm, fields=cls.Meta.fields)
+        if form_class._meta.fields is not None:
+            form_class._meta.fields = tuple(form_class._meta.fields) + tuple(
+                name for name in output_fields if name not in form_class._meta.fields)
+        form_class.related_fields = get_related_fields(form_class, declared_fields)
+        form_class.column_fields = get_column_fields(form_class, declared_fields)
+        form_class.transforms = transforms
+        # the leading transforms which worker processes can apply, as none of their arguments references other objects
+        form_class.worker_transforms = 0
+        for _, _, arguments in transforms:
+            if arguments is None or form_class.related_fields.keys() & set(arguments):
+                break
+            form_class.worker_transforms += 1
+        cls._form_class = form_class
+        return cls._form_class
 
-        self.data = self.parse_data(data)
-        formdict = self._datalist_to_formdict(self.data)
-        max_num = getattr(self.Meta, 'max_items', getattr(settings, 'KUDAGO_MAPPER_MAX_ITEMS', DEFAULT_MAX_ITEMS))
-        self._formset = modelformset_factory(self.model, form=MapperModelForm, formset=MapperModelFormSet,
-                                             fields=self.fields, max_num=max_num)(formdict)
+    @classmethod
+    def get_source_keys(cls):
+        """
+        Collect the keys of the parsed items the mapper uses: the ones mapped to the form fields
+        and the discriminator key. Parsers can skip building the values of the other keys.
+        """
+        form_class = cls.get_form_class()
+        fields = set(form_class.base_fields) | set(cls.declared_fields)
+        field_map = getattr(cls.Meta, 'field_map', {})
+        keys = fields | {key for key, field in field_map.items() if field in fields}
+        discriminator = getattr(cls.Meta, 'discriminator', None)
+        if discriminator is not None:
+            keys.add(discriminator[0])
+        return frozenset(keys)
+
+    @classmethod
+    def get_parser_key(cls):
+        """
+        Identify the way the mapper parses its input: mappers with equal keys get the same items from a payload,
+        so a composite parses it once for all of them. It also keys the entries of Meta.parse_cache.
+        """
+        return cls.parse_data
 
     def parse_data(self, data):
         """
         Abstract method to be implemented by subclasses.
+        Implementations may skip the item keys missing from `self.source_keys`.
         :param data: raw data.
-        :return: parsed data as a list of dictionaries corresponding to objects.
+        :return: parsed data as an iterable of dictionaries corresponding to objects.
         """
         raise NotImplementedError("You should subclass Mapper and implement the parse_data method.")
 
-    def _datalist_to_formdict(self, data):
-        formdict = {
-            'form-TOTAL_FORMS': str(len(data)),
-            'form-INITIAL_FORMS': '0',
-            'form-MAX_NUM_FORMS': '',
-        }
-        for i, item in enumerate(data):
-            for field in item:
-                formdict['form-{}-{}'.format(i, self.field_map.get(field, field))] = item[field]
+    def _parse(self, data):
+        if self.parse_cache is None or not isinstance(data, self.payload_types):
+            return self.parse_data(data)
+        key = self.parse_cache.get_key(data, self.get_parser_key())
+        items = self.parse_cache.get(key)
+        if items is None:
+            self.source_keys = None
+            items = list(self.parse_data(data))
+            self.parse_cache.set(key, items)
+        return items
 
-        return formdict
+    def map_item(self, item):
+        """
+        Rename the parsed item properties to the mapper field names according to Meta.field_map.
+        """
+        field_map = self.field_map
+        return {field_map.get(field, field): value for field, value in item.items()}
+
+    def accepts_item(self, item):
+        """
+        Check whether a parsed item belongs to the mapper according to Meta.discriminator.
+        """
+        discriminator = getattr(self.Meta, 'discriminator', None)
+        if discriminator is None:
+            return True
+        key, check = discriminator
+        if callable(check):
+            return check(item.get(key))
+        return item.get(key) == check
 
-    def save(self, commit=True, raise_invalid=False):
+    def iter_items(self):
+        """
+        Lazily yield the mapped items belonging to the mapper, up to Meta.max_items.
+        """
+        return self._iter_items(self.max_items)
+
+    def _iter_items(self, limit):
+        items = self.data
+        if self.stats is not None:
+            items = self.stats.iter_timed('parse', items, counter='parsed' if self._count_parsed else None)
+        if getattr(self.Meta, 'discriminator', None) is not None:
+            items = filter(self.accepts_item, items)
+        items = (self.map_item(item) for item in items)
+        if self.hash_store is not None:
+            items = self._skip_unchanged(items)
+        return islice(items, limit)
+
+    @classmethod
+    def get_hash_namespace(cls):
+        """
+        Namespace of the item hashes of the mapper in Meta.hash_store.
+        """
+        return '{}.{}'.format(cls.__module__, cls.__name__)
+
+    def _skip_unchanged(self, items):
+        namespace = self.get_hash_namespace()
+        for batch in iter_batches(items, self._get_batch_size()):
+            keyed = []
+            for item in batch:
+                key = item.get(self.key_field)
+                keyed.append((None, None) if key is None else (str(key), item_hash(item)))
+            stored = self.hash_store.get_many(namespace, [key for key, _ in keyed if key is not None])
+            for item, (key, digest) in zip(batch, keyed):
+                if key is not None and stored.get(key) == digest:
+                    self._skipped_keys.append(key)
+                    if self.stats is not None:
+                        self.stats.count('skipped')
+                    continue
+                if key is not None:
+                    self._item_hashes[key] = digest
+                yield item
+
+    def _record_saved(self, forms):
+        if self.hash_store is None:
+            return
+        for form in forms:
+            key = form.data.get(self.key_field)
+            digest = self._item_hashes.pop(str(key), None) if key is not None else None
+            if digest is not None:
+                self._saved_hashes[str(key)] = digest
+
+    def _commit_hashes(self):
+        # the hashes of the saved items are only stored if the outermost transaction commits
+        if not self._saved_hashes:
+            return
+        store, namespace, hashes = self.hash_store, self.get_hash_namespace(), self._saved_hashes
+        self._saved_hashes = {}
+        transaction.on_commit(partial(store.set_many, namespace, hashes), using=router.db_for_write(self.model))
+
+    def iter_forms(self, items=None, instances=None):
+        """
+        Lazily build a bound form for each of the parsed items, up to Meta.max_items.
+        If the form has fields referencing other models, the items are taken in batches of Meta.batch_size
+        and the referenced objects of each batch are fetched with a single query per field.
+        The same goes for the fields returned by `get_column_fields`, which are cleaned a batch at a time,
+        and for the transforms, which are applied to a whole batch of forms validated ahead.
+        With Meta.processes above 1, the batches are cleaned by worker processes first, see `get_processes`.
+        :param items: mapped items to be used instead of the parsed data.
+        :param instances: mapping from Meta.lookup_field values to the objects the matching forms should be bound to.
+        """
+        if items is None:
+            items = self.iter_items()
+
+        column_fields = self.get_column_fields()
+        transforms = self.form_class.transforms
+        processes = self.get_processes()
+        if processes > 1:
+            executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker)
+            batches = iter_submitted(executor, partial(_clean_in_worker, self.__class__),
+                                     iter_batches(items, self._get_batch_size()), window=processes * 2)
+        elif self.form_class.related_fields or column_fields or transforms:
+            executor = None
+            batches = ((batch, None) for batch in iter_batches(items, self._get_batch_size()))
+        else:
+            executor = None
+            batches = (([item], None) for item in items)
+        try:
+            for batch, precleaned in batches:
+                for form in self._build_forms(batch, precleaned, instances, column_fields):
+                    yield form
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _build_forms(self, batch, precleaned, instances, column_fields):
+        if instances:
+            lookup_field = self.Meta.lookup_field
+            to_python = self.model._meta.get_field(lookup_field).to_python
+        related_fields = None
+        converted = [None] * len(batch)
+        with self._timer('prefetch'):
+            if self.form_class.related_fields:
+                related_fields = prefetch_related_fields(self.form_class.related_fields, batch)
+        if precleaned is None:
+            precleaned = [None] * len(batch)
+            with self._timer('convert'):
+                if column_fields:
+                    converted = convert_columns(column_fields, batch)
+        forms = []
+        for item, item_converted, item_precleaned in zip(batch, converted, precleaned):
+            instance = None
+            if instances:
+                try:
+                    instance = instances.get(to_python(item.get(lookup_field)))
+                except ValidationError:
+                    pass
+            forms.append(self.form_class(item, instance=instance, related_fields=related_fields,
+                                         converted=item_converted, cached_fields=self._field_caches,
+                                         precleaned=item_precleaned, stats=self.stats,
+                                         empty_permitted=True, use_required_attribute=False))
+        if self.form_class.transforms:
+            self.form_class.full_clean_batch(forms)
+        return forms
+
+    def get_processes(self):
+        """
+        Number of worker processes cleaning the items, see Meta.processes.
+        """
+        return getattr(self.Meta, 'processes', getattr(settings, 'KUDAGO_MAPPER_PROCESSES', 1))
+
+    def get_cache_stats(self):
+        """
+        Report the use of the caches of Meta.cache_fields.
+        :returns: mapping from the names of the fields to FieldCacheStats.
+        """
+        stats = OrderedDict()
+        for name, clean in self._field_caches.items():
+            info = clean.cache_info()
+            lookups = info.hits + info.misses
+            stats[name] = FieldCacheStats(info.hits, info.misses, info.maxsize, info.currsize,
+                                          info.hits / lookups if lookups else 0.0)
+        return stats
+
+    def _build_field_caches(self):
+        names = getattr(self.Meta, 'cache_fields', ())
+        if not names:
+            return {}
+        size = getattr(self.Meta, 'cache_size', getattr(settings, 'KUDAGO_MAPPER_CACHE_SIZE', DEFAULT_CACHE_SIZE))
+        fields = OrderedDict(self.form_class.base_fields)
+        fields.update(self.declared_fields)
+        caches = OrderedDict()
+        for name in names:
+            if name not in fields:
+                raise ValueError('{} has no field {} to be cached.'.format(self.__class__.__name__, name))
+            if name in self.form_class.related_fields:
+                raise ValueError('{} can\'t cache {}, which references other objects.'.format(
+                    self.__class__.__name__, name))
+            caches[name] = lru_cache(maxsize=size)(partial(clean_field, fields[name]))
+        return caches
+
+    def get_column_fields(self):
+        """
+        Select the form fields whose values are cleaned column-wise for a batch of items rather than
+        one form at a time, see `convert_columns`. The forms clean all their fields by default.
+        """
+        if getattr(self.Meta, 'convert_columns', False):
+            return self.form_class.column_fields
+        return {}
+
+    @_instrumented(emit=False)
+    def validate(self):
+        """
+        Build and validate the forms of all the parsed items ahead of `save`, which will reuse them.
+        :returns: True if all the items are valid.
+        """
+        self._forms = list(self.iter_forms())
+        seen = set()
+        return all([form.validate_unique_among(seen) for form in self._forms])
+
+    def iter_errors(self, forms=None):
+        """
+        Lazily validate the forms, of all the parsed items by default, and report the errors item by item.
+        :returns: iterator of ItemError, one per message.
+        """
+        if forms is None:
+            forms = self._forms if self._forms is not None else self.iter_forms()
+        for index, form in enumerate(forms):
+            for error in self._get_item_errors(index, form):
+                yield error
+
+    def _get_item_errors(self, index, form):
+        if form.is_valid():
+            return []
+        key = form.data.get(self.key_field)
+        return [ItemError(index, key, None if field == NON_FIELD_ERRORS else field, message)
+                for field, messages in form.errors.items() for message in messages]
+
+    @_instrumented()
+    def save(self, commit=True, raise_invalid=False, bulk=False, batch_size=None, max_errors=None):
         """
         Create and (possibly) save the parsed objects.
         :param commit: if True (default), objects will be saved to the database.
         :param raise_invalid: if False (default), invalid objects will be ignored and valid ones will be saved;
-        otherwise, invalid objects will raise an error and nothing will be saved.
+        otherwise, invalid objects will raise InvalidItemsError and nothing will be saved.
+        :param bulk: if True, objects will be inserted with `bulk_create` instead of one query per object.
+        :param batch_size: number of objects per query in the bulk mode,
+        defaults to Meta.batch_size, then to the KUDAGO_MAPPER_BATCH_SIZE setting.
+        :param max_errors: with raise_invalid, number of invalid items the validation stops at,
+        defaults to Meta.max_errors; the items validated ahead in batches are cleaned up to the end of their batch.
         :returns: a list of objects created.
         """
-        if not self._formset.is_valid() and raise_invalid:
-            raise ValueError("The following errors were found: {}".format(self._formset.errors))
+        forms = self._forms if self._forms is not None else self.iter_forms()
+        self._forms = None
+        if raise_invalid:
+            forms = self._check_forms(forms, max_errors)
+
+        forms = (form for form in forms if form.has_changed())
+        if bulk and commit:
+            objects = self._bulk_create(forms, batch_size)
+            self._commit_hashes()
+            return objects
+
+        self._saved_forms = []
+        objects = []
+        for form in self._iter_unique(forms):
+            objects.append(self._save_form(form, commit))
+            if not commit:
+                self._saved_forms.append(form)
+        self._commit_hashes()
+        return objects
+
+    def _iter_unique(self, forms, seen=None):
+        # the forms validated ahead of their save can only be checked against the database, not against each other
+        seen = set() if seen is None else seen
+        return (form for form in forms if form.validate_unique_among(seen))
+
+    def _check_forms(self, forms, max_errors=None):
+        if max_errors is None:
+            max_errors = getattr(self.Meta, 'max_errors', getattr(settings, 'KUDAGO_MAPPER_MAX_ERRORS', None))
+        checked = []
+        errors = []
+        invalid = 0
+        seen = set()
+        for index, form in enumerate(forms):
+            checked.append(form)
+            form.validate_unique_among(seen)
+            item_errors = self._get_item_errors(index, form)
+            if item_errors:
+                errors.extend(item_errors)
+                invalid += 1
+                if invalid == max_errors:
+                    raise InvalidItemsError(errors, complete=False)
+        if errors:
+            raise InvalidItemsError(errors)
+        return checked
+
+    @_instrumented()
+    def save_chunked(self, chunk_size=None, transaction_per_chunk=True, bulk=False):
+        """
+        Validate and save all the parsed items chunk by chunk, regardless of Meta.max_items.
+        The forms of a chunk are released once it is saved, so with a streaming parser
+        the memory usage does not depend on the size of the input. Invalid objects are ignored.
+        :param chunk_size: number of items per chunk, defaults to the batch size (see `save`).
+        :param transaction_per_chunk: if True (default), each chunk is saved in a transaction of its own,
+        so a failure rolls back the current chunk only and the chunks saved before it are kept.
+        :param bulk: if True, the objects of each chunk will be inserted with `bulk_create`.
+        :returns: the number of objects saved.
+        """
+        chunk_size = self._get_batch_size(chunk_size)
+        db = router.db_for_write(self.model)
+        count = 0
+        seen = set()
+        # a single pass over the items, so that the worker processes of Meta.processes are started once
+        # and clean the next batches while a chunk is being saved
+        for chunk in iter_batches(self.iter_forms(self._iter_items(None)), chunk_size):
+            forms = list(self._iter_unique((form for form in chunk if form.has_changed()), seen))
+            if not forms:
+                continue
+            if transaction_per_chunk:
+                with transaction.atomic(using=db):
+                    self._save_forms(forms, bulk, chunk_size)
+            else:
+                self._save_forms(forms, bulk, chunk_size)
+            self._commit_hashes()
+            count += len(forms)
+        return count
+
+    def _save_forms(self, forms, bulk, batch_size):
+        if bulk:
+            self._bulk_create(forms, batch_size)
+        else:
+            for form in forms:
+                self._save_form(form)
+
+    def _save_form(self, form, commit=True):
+        if not commit:
+            return form.save(commit=False)
+        with self._timer('write'):
+            obj = form.save()
+        if self.stats is not None:
+            self.stats.count('saved')
+        self._record_saved((form,))
+        return obj
 
-        return self._formset.save(commit=commit)
+    @classmethod
+    async def afrom_source(cls, source, fetcher=None):
+        """
+        Fetch a source and build the mapper from the payload, parsing it in a thread.
+        :param source: a url or a reader, see `kudago_mapper.aio.fetch_source`.
+        :param fetcher: coroutine function taking the source and returning the payload.
+        """
+        return await load_source(cls, source, fetcher)
+
+    async def asave(self, writer=None, **kwargs):
+        """
+        Validate the parsed items in a thread, then save them in the `writer` executor,
+        which should have a single thread to keep the database writes serialized.
+        The uniqueness of the valid items is checked again before the save, against the objects other sources
+        may have written in the meantime and among the items of the source.
+        :param kwargs: arguments of `save`.
+        """
+        await run_in_thread(self.validate)
+        return await run_in_thread(self._revalidate_and_save, executor=writer, **kwargs)
+
+    def _revalidate_and_save(self, **kwargs):
+        # against the database, then among the forms of the source
+        seen = set()
+        for form in self._forms:
+            if form.is_valid():
+                form.validate_unique()
+            form.validate_unique_among(seen)
+        return self.save(**kwargs)
+
+    def save_m2m(self):
+        """
+        Save the many-to-many data of the objects created by `save(commit=False)`, once they are saved.
+        """
+        for form in self._saved_forms:
+            form.save_m2m()
+
+    @_instrumented()
+    def sync(self, delete_missing=False, batch_size=None):
+        """
+        Synchronize the model table with the parsed objects, matching them on Meta.lookup_field.
+        Only the first Meta.max_items items are synced, the lookup values of the rest are only read so that
+        their objects aren't missing.
+        Existing objects are loaded in one go and updated only if some of their fields changed,
+        new objects are inserted in bulk. Many-to-many data is written for the new objects only.
+        Invalid objects are ignored.
+        :param delete_missing: if True, the objects whose lookup values are absent from the input will be deleted.
+        :param batch_size: number of objects per query, see `save`.
+        :returns: SyncResult of the created, updated and unchanged objects and the lookup values of the missing ones.
+        The objects of the items skipped by Meta.hash_store are in none of the lists.
+        """
+        lookup_field = getattr(self.Meta, 'lookup_field', None)
+        if lookup_field is None:
+            raise ValueError('No lookup_field is specified for {}.'.format(self.__class__.__name__))
+        batch_size = self._get_batch_size(batch_size)
+        model_field = self.model._meta.get_field(lookup_field)
+        manager = self.model._default_manager
+
+        # the keys have to be known before any of the forms is built
+        self._skipped_keys = []
+        all_items = self._iter_items(None)
+        items = list(islice(all_items, self.max_items))
+        keys = set()
+        # neither the items past Meta.max_items nor the ones skipped as unchanged since the previous import
+        # are missing; the skipped keys are only complete once all the items are read
+        rest = (item.get(lookup_field) for item in all_items)
+        for value in chain((item.get(lookup_field) for item in items), rest, self._skipped_keys):
+            try:
+                key = model_field.to_python(value)
+            except ValidationError:
+                continue
+            if key is not None:
+                keys.add(key)
+
+        existing = manager.in_bulk(keys, field_name=lookup_field)
+        concrete_fields = [f for f in self.model._meta.concrete_fields if not f.primary_key]
+        initial = {obj.pk: [getattr(obj, f.attname) for f in concrete_fields] for obj in existing.values()}
+
+        new_forms = {}
+        existing_forms = []
+        updated, unchanged = {}, {}
+        changed_fields = set()
+        for form in self.iter_forms(items, existing):
+            obj = form.instance
+            # an empty item only counts if it is bound to an existing object
+            if (obj.pk is None and not form.has_changed()) or not form.is_valid():
+                continue
+            if obj.pk is None:
+                # the last item wins if the key is repeated, as it does for the existing objects
+                new_forms[getattr(obj, lookup_field)] = form
+                continue
+            existing_forms.append(form)
+            changed = [f.name for f, value in zip(concrete_fields, initial[obj.pk]) if getattr(obj, f.attname) != value]
+            if changed:
+                changed_fields.update(changed)
+                updated[obj.pk] = obj
+                unchanged.pop(obj.pk, None)
+            elif obj.pk not in updated:
+                unchanged[obj.pk] = obj
+
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            created = self._bulk_create(list(new_forms.values()), batch_size)
+            with self._timer('write'):
+                if updated:
+                    manager.db_manager(db).bulk_update(list(updated.values()), sorted(changed_fields),
+                                                       batch_size=batch_size)
+
+                missing = [key for key in manager.db_manager(db).values_list(lookup_field, flat=True)
+                           if key is not None and key not in keys]
+                if delete_missing:
+                    for offset in range(0, len(missing), batch_size):
+                        manager.db_manager(db).filter(
+                            **{'{}__in'.format(lookup_field): missing[offset:offset + batch_size]}).delete()
+            if self.stats is not None:
+                self.stats.count('saved', len(updated))
+            self._record_saved(existing_forms)
+            self._commit_hashes()
+
+        return SyncResult(created, list(updated.values()), list(unchanged.values()), missing)
+
+    def _timer(self, stage):
+        if self.stats is None:
+            return _no_timer
+        return self.stats.timer(stage)
+
+    def _get_batch_size(self, batch_size=None):
+        if batch_size is None:
+            batch_size = getattr(self.Meta, 'batch_size',
+                                 getattr(settings, 'KUDAGO_MAPPER_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        return batch_size
+
+    def _bulk_create(self, forms, batch_size=None):
+        # forms may be lazy, so they are validated and written batch by batch,
+        # leaving out the ones repeating the unique values of the forms before them
+        batch_size = self._get_batch_size(batch_size)
+        db = router.db_for_write(self.model)
+        objects = []
+        with transaction.atomic(using=db):
+            for batch in iter_batches(self._iter_unique(forms), batch_size):
+                with self._timer('write'):
+                    objects.extend(self._bulk_create_batch(batch, db))
+                if self.stats is not None:
+                    self.stats.count('saved', len(batch))
+                self._record_saved(batch)
+
+        return objects
+
+    def _bulk_create_batch(self, forms, db):
+        objects = [form.instance for form in forms]
+        m2m_fields = [f for f in self.model._meta.many_to_many if f.name in forms[0].fields]
+        # links to the primary keys can only be written after the objects got them,
+        # which not every backend returns from a bulk insert
+        through_links = {}
+        for form in forms:
+            form.through_links = through_links
+        if (any(m2m_requires_pk(f) for f in m2m_fields) and
+                not connections[db].features.can_return_ids_from_bulk_insert):
+            for form in forms:
+                form.save()
+        else:
+            self.model._default_manager.using(db).bulk_create(objects)
+            if m2m_fields:
+                for form in forms:
+                    form._save_m2m()
+
+        ignore_conflicts = getattr(self.Meta, 'ignore_m2m_conflicts', False)
+        for through, links in through_links.items():
+            through._default_manager.using(db).bulk_create(links, ignore_conflicts=ignore_conflicts)
+
+        return objects
 
 
 class RSSMapper(Mapper):
@@ -121,33 +1032,210 @@ class RSSMapper(Mapper):
     where each item corresponds to an object.
     """
     def parse_data(self, data):
-        data = XmlListConfig(ElementTree.fromstring(data))
+        data = parse_xml(data, keys=self.source_keys)
         return data
 
 
+class StreamingRSSMapper(RSSMapper):
+    """
+    Mapper for the same xml input as RSSMapper, read incrementally from a file path, a file-like object or bytes.
+    Items are yielded one by one and discarded once processed, so the parsed feed is never held in memory as a whole.
+    """
+    # a string is a path, whose file may change
+    payload_types = (bytes,)
+
+    def parse_data(self, data):
+        if isinstance(data, bytes):
+            data = io.BytesIO(data)
+        return iter_xml_items(data, keys=self.source_keys)
+
+
+class JSONMapper(Mapper):
+    """
+    Mapper for json input, read incrementally from a file-like object or a json string.
+    The items are taken from Meta.item_path, a dot-separated path where a name selects an object member
+    and '*' selects every element of an array, e.g. 'results.*' for {"count": ..., "results": [item, ...]}.
+    It defaults to '*', an array of items at the top level.
+    Items are yielded one by one, so the document is never held in memory as a whole.
+    """
+    @classmethod
+    def get_parser_key(cls):
+        return cls.parse_data, cls.get_item_path()
+
+    @classmethod
+    def get_item_path(cls):
+        return getattr(cls.Meta, 'item_path', '*')
+
+    def parse_data(self, data):
+        return iter_json_items(data, self.get_item_path())
+
+
+class JSONLinesMapper(Mapper):
+    """
+    Mapper for json lines input, with an item per line, read incrementally from a file-like object or a string.
+    """
+    def parse_data(self, data):
+        return iter_json_lines(data)
+
+
+class CSVMapper(Mapper):
+    """
+    Mapper for csv input with a header row, read incrementally from a file-like object or a csv string.
+    Only the columns used by the mapper are kept. Meta.csv_options are passed on to `csv.reader`.
+    As the values are all strings, Meta.convert_columns is on unless set otherwise:
+    the integer, decimal and datetime fields are cleaned column-wise, custom fields by the forms.
+    """
+    def get_column_fields(self):
+        if getattr(self.Meta, 'convert_columns', True):
+            return self.form_class.column_fields
+        return {}
+
+    @classmethod
+    def get_parser_key(cls):
+        return cls.parse_data, tuple(sorted(getattr(cls.Meta, 'csv_options', {}).items()))
+
+    def parse_data(self, data):
+        return iter_csv_items(data, keys=self.source_keys, **getattr(self.Meta, 'csv_options', {}))
+
+
 class MapperComposite(object):
     """
     Represents a composition of mappers applied on the input with objects of multiple classes.
+    The input is parsed once per distinct parser key (see `Mapper.get_parser_key`) and the items are shared
+    by the mappers.
+    The items are routed to the mappers declaring Meta.discriminator once, before any validation.
+    In the stats of the mappers (see Mapper Meta.stats), the shared items are counted as parsed once,
+    by the mapper parsing them.
+
+    The mappers are run in stages derived from the relations of their models: a mapper is saved after the mappers
+    of the models it references, and after the previous mappers of its own model. The mappers of a stage are
+    independent and can be validated concurrently with Meta.workers, unless the composite is saved inside
+    a transaction, which other threads can't see.
 
     Internal Meta class supports the following properties:
-        - mappers: an iterable of at least 2 Mapper subclasses (required)
+        - mappers: an iterable of at least 2 Mapper subclasses (required); if some elements are tuples of mappers,
+        the stages are taken as declared instead
+        - workers: maximum number of threads validating the mappers of a stage ahead of their save, defaults to 1,
+        the mappers validating their items lazily while saving. The cleaning holds the GIL, so the threads only pay
+        off when the validation waits on the database, e.g. a remote one.
     """
     def __init__(self, payload):
-        if not hasattr(self, 'Meta') or not hasattr(self.Meta, 'mappers') or len(self.Meta.mappers) < 2:
+        if not hasattr(self, 'Meta') or not hasattr(self.Meta, 'mappers'):
+            raise ValueError('{} requires at least 2 mappers.'.format(self.__class__.__name__))
+        if any(isinstance(stage, (list, tuple)) for stage in self.Meta.mappers):
+            stages = [tuple(stage) if isinstance(stage, (list, tuple)) else (stage,) for stage in self.Meta.mappers]
+        else:
+            stages = get_dependency_stages(self.Meta.mappers)
+        if sum(len(stage) for stage in stages) < 2:
             raise ValueError('{} requires at least 2 mappers.'.format(self.__class__.__name__))
         self.mappers = []
+        self.stages = []
+
+        # parser key -> keys used by any of its mappers
+        source_keys = {}
+        for stage in stages:
+            for mapper_class in stage:
+                keys = source_keys.setdefault(mapper_class.get_parser_key(), set())
+                keys.update(mapper_class.get_source_keys())
 
-        for mapper in self.Meta.mappers:
-            self.mappers.append(mapper(payload))
+        # parser key -> parsed items
+        parsed = {}
+        for stage in stages:
+            self.stages.append([])
+            for mapper_class in stage:
+                parser_key = mapper_class.get_parser_key()
+                if parser_key in parsed:
+                    mapper = mapper_class(parsed[parser_key], parsed=True)
+                else:
+                    mapper = mapper_class(payload, source_keys=frozenset(source_keys[parser_key]))
+                    with mapper._timer('parse'):
+                        mapper.data = parsed[parser_key] = list(mapper.data)
+                    if mapper.stats is not None:
+                        mapper.stats.count('parsed', len(mapper.data))
+                mapper._count_parsed = False
+                self.mappers.append(mapper)
+                self.stages[-1].append(mapper)
 
-    def save(self, commit=True):
+        self._route_items()
+
+    @classmethod
+    async def afrom_source(cls, source, fetcher=None):
+        """
+        Fetch a source and build the composite from the payload, parsing it in a thread, see `Mapper.afrom_source`.
+        """
+        return await load_source(cls, source, fetcher)
+
+    async def asave(self, writer=None, **kwargs):
+        """
+        Validate and save the mappers in the `writer` executor, as the mappers of a stage
+        reference the objects saved by the previous ones.
+        :param kwargs: arguments of `save`.
+        """
+        return await run_in_thread(self.save, executor=writer, **kwargs)
+
+    def get_stats(self):
+        """
+        Merge the stats of the mappers measuring their work, see Mapper.Meta.stats.
+        :returns: MapperStats, or None if none of the mappers has stats.
+        """
+        stats = [mapper.stats for mapper in self.mappers if mapper.stats is not None]
+        if not stats:
+            return None
+        merged = MapperStats(self.__class__.__name__)
+        for mapper_stats in stats:
+            merged.merge(mapper_stats)
+        return merged
+
+    def _route_items(self):
+        # partition the shared items by the discriminator values in a single pass per key,
+        # so that each mapper only gets the items belonging to it
+        partitions = {}
+        for mapper in self.mappers:
+            discriminator = getattr(mapper.Meta, 'discriminator', None)
+            if discriminator is None or callable(discriminator[1]):
+                continue
+            key, value = discriminator
+            partition_key = (id(mapper.data), key)
+            if partition_key not in partitions:
+                partition = partitions[partition_key] = {}
+                for item in mapper.data:
+                    partition.setdefault(item.get(key), []).append(item)
+            mapper.data = partitions[partition_key].get(value, [])
+
+    def validate(self, stage):
+        """
+        Validate the mappers of a stage concurrently, if there are several and Meta.workers allows it.
+        """
+        workers = min(getattr(self.Meta, 'workers', 1), len(stage))
+        in_transaction = any(connections[router.db_for_write(mapper.model)].in_atomic_block for mapper in stage)
+        if workers < 2 or in_transaction:
+            # the mappers will validate their items lazily while saving
+            return
+
+        def validate(mapper):
+            try:
+                mapper.validate()
+            finally:
+                # the worker threads get their own connections
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # propagate the exceptions
+            list(executor.map(validate, stage))
+
+    def save(self, commit=True, bulk=False, batch_size=None):
         """
         Create and (possibly) save the parsed objects.
+        The mappers are saved stage by stage, each stage after it has been validated.
         :param commit: if True (default), objects will be saved to the database.
+        :param bulk: if True, each mapper inserts its objects with `bulk_create` (see Mapper.save).
+        :param batch_size: number of objects per query in the bulk mode.
         :returns: a list of objects created.
         """
         res = []
-        for mapper in self.mappers:
-            res.extend(mapper.save(commit=commit))
+        for stage in self.stages:
+            self.validate(stage)
+            for mapper in stage:
+                res.extend(mapper.save(commit=commit, bulk=bulk, batch_size=batch_size))
 
         return res
@@ -1,17 +1,82 @@
+import codecs
+import csv
+import io
+import json
+import sys
+from xml.etree import ElementTree
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+
+def _list_item(element):
+    # the value an element gets as a member of XmlListConfig, or None if it is skipped
+    if element:
+        # treat like dict
+        if len(element) == 1 or element[0].tag != element[1].tag:
+            return XmlDictConfig(element)
+        # treat like list
+        return XmlListConfig(element)
+    elif element.text:
+        text = element.text.strip()
+        if text:
+            return text
+    return None
+
+
+def _fast_list_item(element, keys=None):
+    # same as _list_item, producing the values with the optimized functions below
+    if len(element):
+        if len(element) == 1 or element[0].tag != element[1].tag:
+            return _fast_dict(element, keys)
+        return _fast_list(element)
+    text = element.text
+    if text:
+        text = text.strip()
+        if text:
+            return text
+    return None
+
+
 class XmlListConfig(list):
     def __init__(self, aList):
         for element in aList:
-            if element:
-                # treat like dict
-                if len(element) == 1 or element[0].tag != element[1].tag:
-                    self.append(XmlDictConfig(element))
-                # treat like list
-                elif element[0].tag == element[1].tag:
-                    self.append(XmlListConfig(element))
-            elif element.text:
-                text = element.text.strip()
-                if text:
-                    self.append(text)
+            value = _list_item(element)
+            if value is not None:
+                self.append(value)
+
+
+def iter_xml_items(source, keys=None):
+    """
+    Incrementally parse xml of type
+    <root>
+    <item>...</item>
+    ...
+    </root>
+    yielding the items one at a time, each in the same form XmlListConfig(root) would contain it.
+    Every item is cleared as soon as it is converted, so memory usage is bounded by the size of a single item.
+    :param source: a file path or a file-like object.
+    :param keys: if given, only these keys of the items are built (see parse_xml).
+    """
+    root = None
+    depth = 0
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        value = _fast_list_item(element, keys)
+        element.clear()
+        # drop the reference kept by the root as well
+        root.clear()
+        if value is not None:
+            yield value
 
 
 class XmlDictConfig(dict):
@@ -75,3 +140,304 @@ class XmlDictConfig(dict):
                         self[key] = [other[key], self[key]]
             else:
                 self[key] = other[key]
+
+
+# Optimized construction of XmlListConfig and XmlDictConfig values, giving exactly the same output.
+# The merging of repeated tags done by XmlDictConfig.update is inlined, and the keys are interned,
+# so that equal keys of all the items share a single string.
+
+_tags = {}
+_attr_keys = {}
+
+
+def _tag(tag):
+    try:
+        return _tags[tag]
+    except KeyError:
+        _tags[tag] = key = sys.intern(tag)
+        return key
+
+
+def _attr_key(name):
+    try:
+        return _attr_keys[name]
+    except KeyError:
+        _attr_keys[name] = key = sys.intern('attr_{}'.format(name))
+        return key
+
+
+def _merge(target, key, value):
+    # XmlDictConfig.update for a single key
+    if key in target:
+        existing = target[key]
+        if isinstance(existing, list):
+            if isinstance(value, list):
+                existing.extend(value)
+            else:
+                existing.append(value)
+        elif isinstance(value, list):
+            target[key] = [existing] + value
+        else:
+            target[key] = [value, existing]
+    else:
+        target[key] = value
+
+
+def _fast_list(parent):
+    result = XmlListConfig(())
+    append = result.append
+    for element in parent:
+        value = _fast_list_item(element)
+        if value is not None:
+            append(value)
+    return result
+
+
+def _fast_dict(parent, keys=None):
+    # keys: if given, only the children and attributes with these keys are built
+    result = XmlDictConfig.__new__(XmlDictConfig)
+    for name, value in parent.items():
+        key = _attr_keys.get(name) or _attr_key(name)
+        if keys is None or key in keys:
+            result[key] = value
+    for element in parent:
+        tag = element.tag
+        tag = _tags.get(tag) or _tag(tag)
+        if keys is not None and tag not in keys:
+            continue
+        size = len(element)
+        if size:
+            if size == 1 or element[0].tag != element[1].tag:
+                value = _fast_dict(element)
+                # XmlDictConfig merges the attributes into its own copy of them once more
+                for name, attr in element.items():
+                    _merge(value, _attr_keys.get(name) or _attr_key(name), attr)
+            else:
+                value = {_tag(element[0].tag): _fast_list(element)}
+                for name, attr in element.items():
+                    value[_attr_keys.get(name) or _attr_key(name)] = attr
+        else:
+            attrs = element.items()
+            if attrs:
+                value = {_attr_keys.get(name) or _attr_key(name): attr for name, attr in attrs}
+            else:
+                value = element.text
+        if tag in result:
+            _merge(result, tag, value)
+        else:
+            result[tag] = value
+    return result
+
+
+def parse_xml(data, use_lxml=None, keys=None):
+    """
+    Parse xml of type
+    <root>
+    <item>...</item>
+    ...
+    </root>
+    into the same XmlListConfig as XmlListConfig(ElementTree.fromstring(data)), faster and with less allocations.
+    :param data: xml string or bytes.
+    :param use_lxml: whether to parse with lxml; defaults to using it if it is installed.
+    :param keys: if given, only the item properties with these keys (tags or 'attr_' prefixed attribute names)
+    are built, the others are skipped without being converted.
+    """
+    if use_lxml is None:
+        use_lxml = lxml_etree is not None
+    if use_lxml:
+        if lxml_etree is None:
+            raise ImportError('lxml is not installed.')
+        # the external entities are rejected as by ElementTree, so that a feed can't read local files or urls
+        parser_kwargs = {'remove_comments': True, 'remove_pis': True, 'resolve_entities': 'internal',
+                         'no_network': True}
+        if isinstance(data, str):
+            # lxml doesn't accept strings with an encoding declaration
+            data = data.encode('utf-8')
+            parser_kwargs['encoding'] = 'utf-8'
+        root = lxml_etree.fromstring(data, parser=lxml_etree.XMLParser(**parser_kwargs))
+    else:
+        root = ElementTree.fromstring(data)
+    if keys is None:
+        return _fast_list(root)
+
+    result = XmlListConfig(())
+    for element in root:
+        value = _fast_list_item(element, keys)
+        if value is not None:
+            result.append(value)
+    return result
+
+
+DEFAULT_JSON_CHUNK_SIZE = 64 * 1024
+
+_json_decoder = json.JSONDecoder()
+_json_whitespace = ' \t\n\r'
+# the characters a json number can go on with
+_json_number_chars = '.eE+-0123456789'
+
+
+class _JSONScanner(object):
+    # incremental reader of a json document, decoding values with raw_decode over a sliding buffer
+
+    def __init__(self, source, chunk_size):
+        if isinstance(source, (str, bytes)):
+            source = io.BytesIO(source) if isinstance(source, bytes) else io.StringIO(source)
+        self.source = source
+        self.chunk_size = chunk_size
+        self.decoder = None
+        self.buffer = ''
+        self.pos = 0
+        # position of the buffer in the document
+        self.offset = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        chunk = self.source.read(size or self.chunk_size)
+        self.eof = not chunk
+        if isinstance(chunk, bytes):
+            if self.decoder is None:
+                self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+            chunk = self.decoder.decode(chunk, final=self.eof)
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    @property
+    def position(self):
+        return self.offset + self.pos
+
+    def peek(self):
+        # the next non-whitespace character, or '' at the end of the document
+        while True:
+            buffer, pos = self.buffer, self.pos
+            while pos < len(buffer) and buffer[pos] in _json_whitespace:
+                pos += 1
+            self.pos = pos
+            if pos < len(buffer) or self.eof:
+                return buffer[pos:pos + 1]
+            self.fill()
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError('Expected {} at position {} of the json input, got {!r}.'.format(
+                ' or '.join(repr(c) for c in chars), self.position, char))
+        self.pos += 1
+        return char
+
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _json_decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # a number may go on in the next chunk, even if its integer part ends the buffer before it
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in _json_number_chars):
+                    self.pos = end
+                    return value
+            # the value doesn't fit in the buffer, grow it geometrically to keep retries cheap
+            self.fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+
+def _iter_json_path(scanner, path):
+    if not path:
+        yield scanner.decode()
+        return
+    step, path = path[0], path[1:]
+    if step == '*':
+        scanner.expect('[')
+        if scanner.peek() == ']':
+            scanner.pos += 1
+            return
+        while True:
+            for value in _iter_json_path(scanner, path):
+                yield value
+            if scanner.expect(',]') == ']':
+                return
+
+    scanner.expect('{')
+    if scanner.peek() == '}':
+        scanner.pos += 1
+        return
+    while True:
+        scanner.peek()
+        position = scanner.position
+        key = scanner.decode()
+        if not isinstance(key, str):
+            raise ValueError('Expected an object key at position {} of the json input.'.format(position))
+        scanner.expect(':')
+        if key == step:
+            for value in _iter_json_path(scanner, path):
+                yield value
+        else:
+            scanner.decode()
+        if scanner.expect(',}') == '}':
+            return
+
+
+def iter_json_items(source, item_path='*', chunk_size=DEFAULT_JSON_CHUNK_SIZE):
+    """
+    Incrementally parse a json document, yielding the values found at item_path one at a time.
+    Only a single item and the input chunk being read are kept in memory;
+    the values outside of item_path are decoded to be skipped.
+    :param source: a file-like object in text or binary mode, or a json string or bytes.
+    :param item_path: dot-separated path to the items, where a name selects an object member
+    and '*' selects every element of an array, e.g. 'results.*' for {"results": [item, ...]}.
+    :param chunk_size: number of characters or bytes read from the source at once.
+    """
+    scanner = _JSONScanner(source, chunk_size)
+    path = tuple(item_path.split('.')) if item_path else ()
+    for value in _iter_json_path(scanner, path):
+        yield value
+    if scanner.peek():
+        raise ValueError('Extra data at position {} of the json input.'.format(scanner.position))
+
+
+def iter_json_lines(source):
+    """
+    Parse json lines, yielding the value of every non-blank line one at a time.
+    :param source: a file-like object in text or binary mode, or a string or bytes.
+    """
+    if isinstance(source, (str, bytes)):
+        source = source.splitlines()
+    for number, line in enumerate(source, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise ValueError('Invalid json at line {}: {}'.format(number, e))
+
+
+def iter_csv_items(source, keys=None, **fmtparams):
+    """
+    Parse csv with a header row, yielding a dict per row one at a time.
+    Missing trailing values are None, like with `csv.DictReader`.
+    :param source: a file-like object in text or binary mode (opened with newline=''), or csv string or bytes.
+    :param keys: if given, only the columns with these names are kept.
+    :param fmtparams: formatting parameters of `csv.reader`.
+    """
+    if isinstance(source, bytes):
+        source = source.decode('utf-8-sig')
+    if isinstance(source, str):
+        source = io.StringIO(source, newline='')
+    elif isinstance(source.read(0), bytes):
+        source = codecs.iterdecode(source, 'utf-8-sig')
+    reader = csv.reader(source, **fmtparams)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = [(index, name) for index, name in enumerate(header) if keys is None or name in keys]
+    width = len(header)
+    for row in reader:
+        if not row:
+            continue
+        if len(row) < width:
+            row.extend([None] * (width - len(row)))
+        yield {name: row[index] for index, name in columns}
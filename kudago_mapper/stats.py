@@ -0,0 +1,128 @@
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger('kudago_mapper')
+
+STAGES = ('parse', 'prefetch', 'convert', 'validate', 'write', 'total')
+COUNTERS = ('parsed', 'valid', 'invalid', 'saved')
+
+
+class MapperStats(object):
+    """
+    Measurements of the work done by a mapper, accumulated over its calls.
+
+    Attributes:
+        - name: name of the mapper class
+        - timings: wall time in seconds per stage: parse (including the streaming parsers' reads),
+        prefetch (lookups of the referenced objects), convert (column-wise cleaning), validate (forms,
+        including the field and transform times below), write (database writes) and total (the calls
+        of `validate`, `save`, `save_chunked` and `sync`)
+        - counters: numbers of items parsed, valid, invalid and saved, plus skipped with Meta.hash_store
+        - queries: number of queries run during the calls
+        - field_times: time spent cleaning each field
+        - transform_times: time spent applying each transform
+    """
+    def __init__(self, name):
+        self.name = name
+        self.timings = OrderedDict((stage, 0.0) for stage in STAGES)
+        self.counters = OrderedDict((counter, 0) for counter in COUNTERS)
+        self.queries = 0
+        self.field_times = OrderedDict()
+        self.transform_times = OrderedDict()
+
+    def add_time(self, stage, seconds):
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def add_field_time(self, name, seconds):
+        self.field_times[name] = self.field_times.get(name, 0.0) + seconds
+
+    def add_transform_time(self, name, seconds):
+        self.transform_times[name] = self.transform_times.get(name, 0.0) + seconds
+
+    def count(self, counter, number=1):
+        self.counters[counter] = self.counters.get(counter, 0) + number
+
+    @contextmanager
+    def timer(self, stage):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, perf_counter() - start)
+
+    def iter_timed(self, stage, iterable, counter=None):
+        """
+        Yield from an iterable, adding the time spent producing the values to the stage.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                self.add_time(stage, perf_counter() - start)
+                return
+            self.add_time(stage, perf_counter() - start)
+            if counter is not None:
+                self.count(counter)
+            yield value
+
+    def query_counter(self, execute, sql, params, many, context):
+        # a database execute wrapper, see `connection.execute_wrapper`
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def merge(self, other):
+        """
+        Add the measurements of other stats to these ones.
+        """
+        for stage, seconds in other.timings.items():
+            self.add_time(stage, seconds)
+        for counter, number in other.counters.items():
+            self.count(counter, number)
+        self.queries += other.queries
+        for name, seconds in other.field_times.items():
+            self.add_field_time(name, seconds)
+        for name, seconds in other.transform_times.items():
+            self.add_transform_time(name, seconds)
+        return self
+
+    def as_dict(self):
+        """
+        Flatten the measurements into dotted metric names, e.g. 'timings.parse' or 'fields.price_min'.
+        """
+        metrics = OrderedDict()
+        for prefix, values in (('timings', self.timings), ('counters', self.counters),
+                               ('fields', self.field_times), ('transforms', self.transform_times)):
+            for name, value in values.items():
+                metrics['{}.{}'.format(prefix, name)] = value
+        metrics['queries'] = self.queries
+        return metrics
+
+    def __repr__(self):
+        return '<{} {}: {}>'.format(self.__class__.__name__, self.name, dict(self.as_dict()))
+
+
+def log_stats(stats):
+    """
+    Stats hook writing the measurements to the 'kudago_mapper' logger.
+    """
+    metrics = ', '.join('{}={:.6g}'.format(name, value) for name, value in stats.as_dict().items())
+    logger.info('%s: %s', stats.name, metrics)
+
+
+def get_stats_hook(meta):
+    """
+    Find the hook the stats are emitted to: Meta.stats_hook, then the KUDAGO_MAPPER_STATS_HOOK setting,
+    either a callable or its dotted path.
+    """
+    hook = getattr(meta, 'stats_hook', getattr(settings, 'KUDAGO_MAPPER_STATS_HOOK', None))
+    if isinstance(hook, str):
+        hook = import_string(hook)
+    return hook
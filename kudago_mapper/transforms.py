@@ -5,12 +5,17 @@ class MapperTransform(object):
 
     Internal Meta class supports the following properties:
         - fields: mapper fields to be given as arguments to the __call__ method, defaults to all the fields.
+        - output_fields: fields the __call__ method may return; if not declared, any model field can be returned.
     """
     def __init__(self, *args, **kwargs):
         try:
             self.fields = self.Meta.fields
         except AttributeError:
             self.fields = '__all__'
+        try:
+            self.output_fields = tuple(self.Meta.output_fields)
+        except AttributeError:
+            self.output_fields = None
 
     def __call__(self, **kwargs):
         """
@@ -20,6 +25,18 @@ class MapperTransform(object):
         """
         raise NotImplementedError("You should subclass MapperTransform and implement the __call__ method.")
 
+    def apply_batch(self, rows):
+        """
+        Perform the transformation for a batch of items at once.
+        Subclasses may override it with a faster implementation equivalent to calling __call__ per item.
+        :param rows: a list of mappings with the mapper field values of an item each.
+        :return: a list with the __call__ result for every row.
+        """
+        if self.fields == '__all__':
+            return [self(**row) for row in rows]
+        fields = self.fields
+        return [self(**{field: row[field] for field in fields}) for row in rows]
+
 
 class SplitMapperTransform(MapperTransform):
     """
@@ -33,12 +50,21 @@ class SplitMapperTransform(MapperTransform):
         self.from_field = from_field
         self.to_fields = to_fields
         self.sep = sep
+        self.output_fields = tuple(to_fields)
 
     def __call__(self, **kwargs):
         elems = kwargs[self.from_field].split(self.sep)
         # ignoring possible mismatches in length
         return dict(zip(self.to_fields, elems))
 
+    def apply_batch(self, rows):
+        # subclasses changing __call__ only get the generic implementation
+        if type(self).__call__ is not SplitMapperTransform.__call__:
+            return super(SplitMapperTransform, self).apply_batch(rows)
+        from_field, to_fields, sep = self.from_field, self.to_fields, self.sep
+        column = [row[from_field] for row in rows]
+        return [dict(zip(to_fields, value.split(sep))) for value in column]
+
 
 class StackMapperTransform(MapperTransform):
     """
@@ -52,7 +78,16 @@ class StackMapperTransform(MapperTransform):
         self.from_fields = from_fields
         self.to_field = to_field
         self.sep = sep
+        self.output_fields = (to_field,)
 
     def __call__(self, **kwargs):
         elems = [kwargs[from_field] for from_field in self.from_fields]
         return {self.to_field: self.sep.join(elems)}
+
+    def apply_batch(self, rows):
+        # subclasses changing __call__ only get the generic implementation
+        if type(self).__call__ is not StackMapperTransform.__call__:
+            return super(StackMapperTransform, self).apply_batch(rows)
+        to_field, join = self.to_field, self.sep.join
+        columns = [[row[from_field] for row in rows] for from_field in self.from_fields]
+        return [{to_field: join(elems)} for elems in zip(*columns)]
@@ -1,13 +1,310 @@
-from collections import OrderedDict
-from itertools import chain
+import copy
+from collections import OrderedDict, deque
+from decimal import Decimal
+from functools import lru_cache
+from itertools import chain, islice
 
-from django.forms import ModelForm
-from django.db.models import ForeignKey
+from django.core.exceptions import ValidationError
+from django.forms import ModelForm, ModelChoiceField, IntegerField, DecimalField, DateTimeField
+from django.db import connections
+from django.db.models import ForeignKey, QuerySet
 
 from kudago_mapper.transforms import MapperTransform
 from kudago_mapper.fields import Field
 
 
+def iter_batches(iterable, size):
+    """
+    Split an iterable into lists of at most `size` elements, consuming it lazily.
+    """
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def iter_submitted(executor, func, iterable, window):
+    """
+    Lazily apply a function to the values of an iterable in an executor, in order,
+    with at most `window` calls submitted ahead of the consumer.
+    :returns: iterator of (value, result) pairs.
+    """
+    pending = deque()
+    for value in iterable:
+        pending.append((value, executor.submit(func, value)))
+        if len(pending) >= window:
+            value, future = pending.popleft()
+            yield value, future.result()
+    while pending:
+        value, future = pending.popleft()
+        yield value, future.result()
+
+
+class PrefetchedQuerySet(QuerySet):
+    """
+    QuerySet answering the lookups on a single field from the objects fetched beforehand.
+    Exact and `__in` lookups of the prefetched values don't hit the database,
+    everything else behaves as a regular QuerySet.
+    Only `all()` keeps the prefetched objects, any other chained QuerySet is a regular one.
+    """
+    def __init__(self, *args, **kwargs):
+        super(PrefetchedQuerySet, self).__init__(*args, **kwargs)
+        self._lookup_field = None
+        # prefetched value -> object, or None if no object has that value
+        self._lookup_objects = None
+        self._lookup_order = None
+
+    @classmethod
+    def prefetch(cls, queryset, field_name, values):
+        """
+        Fetch the objects of the queryset having the given values of the field with a single query.
+        Values which are not valid for the field are skipped.
+        """
+        model_field = queryset.model._meta.pk if field_name == 'pk' else queryset.model._meta.get_field(field_name)
+        keys = set()
+        for value in values:
+            try:
+                key = model_field.to_python(value)
+            except ValidationError:
+                continue
+            if key is not None:
+                keys.add(key)
+
+        # the order of the query results is kept, so that lookups return the objects in the same order as the database
+        objects = OrderedDict()
+        keys = list(keys)
+        batch_size = connections[queryset.db].features.max_query_params or len(keys) or 1
+        for offset in range(0, len(keys), batch_size):
+            for obj in queryset.filter(**{'{}__in'.format(field_name): keys[offset:offset + batch_size]}):
+                objects[getattr(obj, field_name)] = obj
+
+        prefetched = cls(model=queryset.model, query=queryset.query.chain(), using=queryset._db,
+                         hints=queryset._hints)
+        prefetched._lookup_field = field_name
+        prefetched._lookup_objects = dict.fromkeys(keys)
+        prefetched._lookup_objects.update(objects)
+        prefetched._lookup_order = {key: i for i, key in enumerate(objects)}
+        return prefetched
+
+    def all(self):
+        clone = super(PrefetchedQuerySet, self).all()
+        clone._lookup_field = self._lookup_field
+        clone._lookup_objects = self._lookup_objects
+        clone._lookup_order = self._lookup_order
+        return clone
+
+    def _lookup(self, kwargs):
+        # the prefetched objects matching the lookup, or None if it can't be answered without a query
+        if self._lookup_objects is None or len(kwargs) != 1:
+            return None
+        (lookup, value), = kwargs.items()
+        if lookup == self._lookup_field:
+            values = (value,)
+        elif lookup == '{}__in'.format(self._lookup_field):
+            values = value
+        else:
+            return None
+
+        model_field = self.model._meta.pk if self._lookup_field == 'pk' else self.model._meta.get_field(
+            self._lookup_field)
+        keys = set()
+        for value in values:
+            try:
+                key = model_field.to_python(value)
+            except ValidationError as e:
+                # a query would fail on the value the same way
+                raise ValueError(e.messages[0])
+            if key not in self._lookup_objects:
+                return None
+            if self._lookup_objects[key] is not None:
+                keys.add(key)
+        return [self._lookup_objects[key] for key in sorted(keys, key=self._lookup_order.get)]
+
+    def get(self, *args, **kwargs):
+        objects = None if args else self._lookup(kwargs)
+        if objects is None:
+            return super(PrefetchedQuerySet, self).get(*args, **kwargs)
+        if not objects:
+            raise self.model.DoesNotExist(
+                "{} matching query does not exist.".format(self.model._meta.object_name))
+        return objects[0]
+
+    def filter(self, *args, **kwargs):
+        objects = None if args else self._lookup(kwargs)
+        clone = super(PrefetchedQuerySet, self).filter(*args, **kwargs)
+        if objects is not None:
+            clone._result_cache = objects
+            clone._prefetch_done = True
+        return clone
+
+
+def prefetch_related_fields(fields, items):
+    """
+    Resolve the references of a batch of items with a single query per related field.
+    :param fields: mapping from the names to the ModelChoiceField instances of the fields to be resolved.
+    :param items: mapped items, the values of the fields are the referenced keys,
+    either single, in lists or separated by commas.
+    :returns: mapping from the names to copies of the fields backed by PrefetchedQuerySet.
+    """
+    related = OrderedDict()
+    for name, field in fields.items():
+        values = []
+        for item in items:
+            value = item.get(name)
+            if isinstance(value, (list, tuple)):
+                values.extend(value)
+            elif isinstance(value, str):
+                values.append(value)
+                values.extend(part.strip() for part in value.split(','))
+            elif value is not None:
+                values.append(value)
+
+        field = copy.deepcopy(field)
+        queryset = field.queryset
+        limit_choices_to = field.get_limit_choices_to()
+        if limit_choices_to is not None:
+            queryset = queryset.complex_filter(limit_choices_to)
+        field.queryset = PrefetchedQuerySet.prefetch(queryset, field.to_field_name or 'pk', values)
+        related[name] = field
+
+    return related
+
+
+def get_related_fields(form_class, declared_fields):
+    """
+    Collect the fields of a mapper form referencing other models.
+    """
+    fields = OrderedDict(form_class.base_fields)
+    fields.update(declared_fields)
+    return OrderedDict((name, field) for name, field in fields.items() if isinstance(field, ModelChoiceField))
+
+
+def _to_integer(field, value):
+    return int(value)
+
+
+def _to_decimal(field, value):
+    value = Decimal(value.strip())
+    if not value.is_finite():
+        raise ValueError(value)
+    return value
+
+
+def _to_datetime(field, value):
+    return field.to_python(value)
+
+
+# exact form field classes whose cleaning is a plain conversion of strings, and the conversions;
+# anything the fast conversion doesn't accept goes through the field's own clean
+COLUMN_CONVERTERS = {
+    IntegerField: _to_integer,
+    DecimalField: _to_decimal,
+    DateTimeField: _to_datetime,
+}
+
+
+def get_column_fields(form_class, declared_fields):
+    """
+    Collect the fields of a mapper form whose values can be converted column-wise, see `convert_columns`.
+    """
+    fields = OrderedDict(form_class.base_fields)
+    fields.update(declared_fields)
+    return OrderedDict((name, field) for name, field in fields.items()
+                       if type(field) in COLUMN_CONVERTERS and not field.localize and not field.disabled)
+
+
+def convert_columns(fields, items):
+    """
+    Clean the values of plain conversion fields for a batch of string items at once, column by column.
+    Every distinct value of a column is converted and validated once and the result is reused for its repetitions.
+    :param fields: mapping from the names to the fields, see `get_column_fields`.
+    :param items: mapped items.
+    :returns: a list with a mapping from the names to the cleaned values or ValidationError per item.
+    """
+    rows = [{} for _ in items]
+    for name, field in fields.items():
+        convert = COLUMN_CONVERTERS[type(field)]
+        cache = {}
+        for row, item in zip(rows, items):
+            value = item.get(name)
+            try:
+                row[name] = cache[value]
+                continue
+            except KeyError:
+                pass
+            except TypeError:
+                # unhashable values are left for the form
+                continue
+            try:
+                if value in field.empty_values or not isinstance(value, str):
+                    raise ValueError(value)
+                converted = convert(field, value)
+            except (ValueError, TypeError, ArithmeticError, ValidationError):
+                try:
+                    converted = field.clean(value)
+                except ValidationError as e:
+                    converted = e
+            else:
+                try:
+                    field.run_validators(converted)
+                except ValidationError as e:
+                    converted = e
+            row[name] = cache[value] = converted
+    return rows
+
+
+def clean_field(field, value):
+    """
+    Clean a value with a form field, returning the ValidationError instead of raising it.
+    """
+    try:
+        return field.clean(value)
+    except ValidationError as e:
+        return e
+
+
+def get_related_models(model):
+    """
+    Collect the models referenced by the foreign keys and m2m fields of a model.
+    """
+    return {f.related_model for f in chain(model._meta.fields, model._meta.many_to_many)
+            if f.is_relation and f.related_model is not None and f.related_model is not model}
+
+
+def get_dependency_stages(mappers):
+    """
+    Split mappers into stages, so that every mapper comes after the mappers of the models its model references.
+    The mappers of the same model are put in separate stages in their declared order, as each one checks its objects
+    against the ones saved by the previous ones. The mappers of a stage don't depend on each other and keep
+    their relative order.
+    :param mappers: an iterable of Mapper subclasses.
+    :returns: a list of stages, each a list of mappers.
+    """
+    mappers = list(mappers)
+    models = {mapper.Meta.model for mapper in mappers}
+    dependencies = {mapper: get_related_models(mapper.Meta.model) & models for mapper in mappers}
+
+    stages = []
+    done = set()
+    while mappers:
+        stage = []
+        stage_models = set()
+        for mapper in mappers:
+            model = mapper.Meta.model
+            if dependencies[mapper] <= done and model not in stage_models:
+                stage.append(mapper)
+            stage_models.add(model)
+        if not stage:
+            raise ValueError('Circular dependency between the models of {}.'.format(
+                ', '.join(mapper.__name__ for mapper in mappers)))
+        stages.append(stage)
+        mappers = [mapper for mapper in mappers if mapper not in stage]
+        # a model is ready once all of its mappers have been saved
+        done = models - {mapper.Meta.model for mapper in mappers}
+    return stages
+
+
 class DeclarativeMapperMetaclass(type):
     """
     Collect Fields and Transforms declared on the base classes.
@@ -55,10 +352,41 @@ class DeclarativeMapperMetaclass(type):
         return OrderedDict()
 
 
+@lru_cache(maxsize=None)
+def get_through_fks(through, model):
+    """
+    Find the foreign keys of a custom through table linking it to the given model and to the other side.
+    :returns: a tuple of the foreign keys (from_field, to_field).
+    """
+    through_fks = tuple(filter(lambda x: isinstance(x, ForeignKey), through._meta.fields))
+    if len(through_fks) != 2:
+        raise ValueError("Only through tables with 2 foreign keys are supported.")
+
+    from_field = through_fks[issubclass(model, through_fks[1].related_model)]
+    to_field = through_fks[issubclass(model, through_fks[0].related_model)]
+    return from_field, to_field
+
+
+def m2m_requires_pk(field):
+    """
+    Check whether saving the links of a m2m field requires the primary key of the model instance.
+    """
+    through = field.remote_field.through
+    if through._meta.auto_created:
+        return True
+    from_field, _ = get_through_fks(through, field.model)
+    return from_field.target_field.primary_key
+
+
 class M2MThroughSavingModelForm(ModelForm):
     # Django doesn't support `to_field` parameter for M2M and one has to use a through table to make non-pk links.
     # It also doesn't support automatic saving for M2M with through tables.
     # This class provides a limited solution.
+
+    # through table -> list of link objects; if set, the links are collected there to be saved in bulk later,
+    # otherwise they are saved in bulk per form
+    through_links = None
+
     def _save_m2m(self):
         cleaned_data = self.cleaned_data
         opts = self.instance._meta
@@ -72,12 +400,10 @@ class M2MThroughSavingModelForm(ModelForm):
                 if through_rel._meta.auto_created:
                     f.save_form_data(self.instance, cleaned_data[f.name])
                 else:
-                    for el in cleaned_data[f.name]:
-                        through_fks = tuple(filter(lambda x: isinstance(x, ForeignKey), through_rel._meta.fields))
-                        if len(through_fks) != 2:
-                            raise ValueError("Only through tables with 2 foreign keys are supported.")
-
-                        from_field = through_fks[isinstance(self.instance, through_fks[1].related_model)]
-                        to_field = through_fks[isinstance(self.instance, through_fks[0].related_model)]
-
-                        through_rel.objects.create(**{from_field.name: self.instance, to_field.name: el})
+                    from_field, to_field = get_through_fks(through_rel, type(self.instance))
+                    links = [through_rel(**{from_field.name: self.instance, to_field.name: el})
+                             for el in cleaned_data[f.name]]
+                    if self.through_links is not None:
+                        self.through_links.setdefault(through_rel, []).extend(links)
+                    elif links:
+                        through_rel._default_manager.bulk_create(links)
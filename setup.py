@@ -14,18 +14,21 @@ setup(
     author_email="fed.tf@yandex.ru",
     url="https://github.com/fed_tf/kudago-mapper/",
     license="BSD License",
-    packages=find_packages(),
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
     zip_safe=False,
     include_package_data=True,
+    python_requires='>=3.7',
+    extras_require={
+        'lxml': ['lxml>=5'],
+    },
     classifiers=[
         "Programming Language :: Python",
         "Topic :: Software Development :: Libraries :: Python Modules",
         "License :: OSI Approved :: BSD License",
         "Programming Language :: Python",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
         "Framework :: Django",
-        "Framework :: Django :: 2.0"
+        "Framework :: Django :: 2.2",
         "Intended Audience :: Developers",
         "Operating System :: OS Independent",
     ],
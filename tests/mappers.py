@@ -1,15 +1,51 @@
 import re
 
-from kudago_mapper.mappers import RSSMapper, MapperComposite
+from django import forms
+
+from kudago_mapper.mappers import (RSSMapper, StreamingRSSMapper, JSONMapper, JSONLinesMapper, CSVMapper,
+                                   MapperComposite)
 from kudago_mapper import fields
+from kudago_mapper.hashes import ModelHashStore
 from kudago_mapper.transforms import MapperTransform, SplitMapperTransform, StackMapperTransform
 
-from .models import Hall, Event, Artist, ArtistThrough, ActionThrough, EventThrough
+from .models import Hall, Event, Action, Artist, ArtistThrough, ActionThrough, EventThrough, ItemHash
 
 
 class HallRSSMapper(RSSMapper):
     type_ = fields.EnsureField('hall')
 
+    class Meta:
+        model = Hall
+        fields = ('name', 'url', 'ext_id')
+        field_map = {'originalUrl': 'url', 'id': 'ext_id', 'type': 'type_'}
+        discriminator = ('type', 'hall')
+
+
+class SyncHallRSSMapper(HallRSSMapper):
+    class Meta:
+        model = Hall
+        fields = ('name', 'url', 'ext_id')
+        field_map = {'originalUrl': 'url', 'id': 'ext_id', 'type': 'type_'}
+        lookup_field = 'ext_id'
+
+
+class HashedHallRSSMapper(SyncHallRSSMapper):
+    class Meta(SyncHallRSSMapper.Meta):
+        hash_store = ModelHashStore(ItemHash)
+        stats = True
+
+
+class PlainSyncHallRSSMapper(RSSMapper):
+    class Meta:
+        model = Hall
+        fields = ('name', 'url', 'ext_id')
+        field_map = {'originalUrl': 'url', 'id': 'ext_id'}
+        lookup_field = 'ext_id'
+
+
+class StreamingHallRSSMapper(StreamingRSSMapper):
+    type_ = fields.EnsureField('hall')
+
     class Meta:
         model = Hall
         fields = ('name', 'url', 'ext_id')
@@ -49,6 +85,7 @@ class ArtistThroughRSSMapper(RSSMapper):
         model = ArtistThrough
         fields = ('ext_id', 'name', )
         field_map = {'id': 'ext_id', 'action': 'actions', 'type': 'type_'}
+        discriminator = ('type', lambda value: value == 'artist')
 
 
 class RubleField(fields.DecimalField):
@@ -130,6 +167,16 @@ class EventTransfRSSMapper(RSSMapper):
         field_map = {'originalUrl': 'url', 'date': 'start_date', 'hall_id': 'hall', 'id': 'ext_id'}
 
 
+class CachedEventTransfRSSMapper(EventTransfRSSMapper):
+    class Meta:
+        model = Event
+        fields = ('url', 'start_date', 'hall', 'ext_id', 'end_date', 'name',
+                  'action', 'price_min', 'price_max')
+        field_map = {'originalUrl': 'url', 'date': 'start_date', 'hall_id': 'hall', 'id': 'ext_id'}
+        cache_fields = ('price_min', 'price_max', 'start_date')
+        cache_size = 2
+
+
 class CheapEventRSSMapper(EventRSSMapper):
     price_min = fields.DecimalField(max_value=400)
 
@@ -141,6 +188,7 @@ class ActionThroughRSSMapper(RSSMapper):
         model = ActionThrough
         fields = '__all__'
         field_map = {'originalUrl': 'url', 'id': 'ext_id', 'type': 'type_'}
+        discriminator = ('type', 'action')
 
 
 class HallActionMapperComposite(MapperComposite):
@@ -148,6 +196,11 @@ class HallActionMapperComposite(MapperComposite):
         mappers = (HallRSSMapper, ActionThroughRSSMapper)
 
 
+class HallsMapperComposite(MapperComposite):
+    class Meta:
+        mappers = (HallRSSMapper, SyncHallRSSMapper)
+
+
 class EventThroughRSSMapper(EventRSSMapper):
     class Meta:
         model = EventThrough
@@ -156,8 +209,71 @@ class EventThroughRSSMapper(EventRSSMapper):
                   'action', 'price_min', 'price_max')
         field_map = {'originalUrl': 'url', 'date': 'start_date', 'hall_id': 'hall', 'id': 'ext_id',
                      'type': 'type_'}
+        discriminator = ('type', 'event')
 
 
 class KassirMapperComposite(MapperComposite):
     class Meta:
         mappers = (HallRSSMapper, ActionThroughRSSMapper, ArtistThroughRSSMapper, EventThroughRSSMapper)
+
+
+class ParallelKassirMapperComposite(MapperComposite):
+    class Meta:
+        mappers = ((HallRSSMapper, ActionThroughRSSMapper), (ArtistThroughRSSMapper, EventThroughRSSMapper))
+        workers = 2
+
+
+class ReversedKassirMapperComposite(MapperComposite):
+    class Meta:
+        mappers = (EventThroughRSSMapper, ArtistThroughRSSMapper, ActionThroughRSSMapper, HallRSSMapper)
+
+
+class HallJSONMapper(JSONMapper):
+    class Meta:
+        model = Hall
+        fields = ('name', 'url', 'ext_id')
+        field_map = {'id': 'ext_id', 'site_url': 'url'}
+        item_path = 'halls.*'
+
+
+class ActionJSONMapper(JSONMapper):
+    class Meta:
+        model = Action
+        fields = ('name', 'url', 'category', 'ext_id')
+        field_map = {'id': 'ext_id', 'site_url': 'url'}
+        item_path = 'actions.*'
+
+
+class HallJSONLinesMapper(JSONLinesMapper):
+    class Meta:
+        model = Hall
+        fields = ('name', 'url', 'ext_id')
+        field_map = {'id': 'ext_id', 'site_url': 'url'}
+
+
+class HallActionJSONMapperComposite(MapperComposite):
+    class Meta:
+        mappers = (HallJSONMapper, ActionJSONMapper)
+
+
+class EventCSVMapper(CSVMapper):
+    start_date = forms.DateTimeField(input_formats=['%d.%m.%Y %H:%M'])
+    end_date = forms.DateTimeField(input_formats=['%d.%m.%Y %H:%M'])
+
+    class Meta:
+        model = Event
+        fields = ('url', 'start_date', 'hall', 'ext_id', 'end_date', 'name', 'category',
+                  'action', 'price_min', 'price_max')
+        field_map = {'id': 'ext_id', 'hall_id': 'hall', 'action_id': 'action'}
+        csv_options = {'delimiter': ';'}
+
+
+class ProcessesEventTransfMultipleRSSMapper(EventTransfMultipleRSSMapper):
+    class Meta(EventTransfMultipleRSSMapper.Meta):
+        processes = 2
+        batch_size = 2
+
+
+class ProcessesCheapEventRSSMapper(CheapEventRSSMapper):
+    class Meta(CheapEventRSSMapper.Meta):
+        processes = 2
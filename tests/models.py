@@ -62,3 +62,12 @@ class EventThrough(EventBase):
 class ArtistToAction(models.Model):
     action = models.ForeignKey(ActionThrough, to_field='ext_id', on_delete=models.CASCADE)
     artist = models.ForeignKey(ArtistThrough, to_field='ext_id', on_delete=models.CASCADE)
+
+
+class ItemHash(models.Model):
+    namespace = models.CharField(max_length=240)
+    key = models.CharField(max_length=240)
+    digest = models.CharField(max_length=40)
+
+    class Meta:
+        unique_together = ('namespace', 'key')
@@ -1,23 +1,127 @@
+import asyncio
+import io
+import json
 import os
+import re
 import datetime
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from unittest import mock
 from decimal import Decimal
-
-from django.test import TestCase
-
-from kudago_mapper.mappers import Mapper
-
-from .models import Action, Event, Hall, Artist, ActionThrough, ArtistThrough, EventThrough
+from xml.etree import ElementTree
+
+from django import forms
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from kudago_mapper.aio import amap_sources, fetch_source
+from kudago_mapper.cache import ParseCache
+from kudago_mapper.hashes import FileHashStore, item_hash
+from kudago_mapper.mappers import Mapper, SyncResult, ItemError, InvalidItemsError
+from kudago_mapper.transforms import SplitMapperTransform, StackMapperTransform
+from kudago_mapper.parsers import (XmlListConfig, iter_xml_items, parse_xml, lxml_etree, iter_json_items,
+                                   iter_json_lines)
+from kudago_mapper.utils import PrefetchedQuerySet
+
+from .models import Action, Event, Hall, Artist, ActionThrough, ArtistThrough, EventThrough, ItemHash
 from .mappers import (HallRSSMapper, EventRSSMapper, ArtistRSSMapper, ArtistThroughRSSMapper,
                       EventTransfRSSMapper, EventTransfMultipleRSSMapper, CheapEventRSSMapper,
-                      HallActionMapperComposite, KassirMapperComposite,)
+                      ProcessesEventTransfMultipleRSSMapper, ProcessesCheapEventRSSMapper,
+                      HallActionMapperComposite, KassirMapperComposite, StreamingHallRSSMapper,
+                      SyncHallRSSMapper, ParallelKassirMapperComposite, ActionThroughRSSMapper,
+                      EventThroughRSSMapper, ReversedKassirMapperComposite, HallJSONMapper,
+                      HallJSONLinesMapper, HallActionJSONMapperComposite, EventCSVMapper, IntSplitTransform,
+                      CachedEventTransfRSSMapper, RubleField, HashedHallRSSMapper, PlainSyncHallRSSMapper,
+                      HallsMapperComposite,)
 
 
-def get_payload(filepath):
+def get_payload_path(filepath):
     test_dir = os.path.abspath(os.path.dirname(__file__))
-    with open(os.path.join(test_dir, 'xml_cases', filepath), encoding='utf8') as f:
+    return os.path.join(test_dir, 'xml_cases', filepath)
+
+
+def get_payload(filepath):
+    with open(get_payload_path(filepath), encoding='utf8') as f:
         return f.read()
 
 
+def repeat_item(payload, type_):
+    """
+    Repeat the first item of the given type in an xml payload.
+    """
+    match = re.search(r' *<item [^>]*type="{}">.*?</item>\n'.format(type_), payload, re.S)
+    return payload[:match.end()] + match.group() + payload[match.end():]
+
+
+class ParserTest(TestCase):
+    def test_iter_xml_items_matches_xml_list_config(self):
+        for case in ('multiple_items.xml', 'multiple_linked_models.xml', 'raw_events.xml'):
+            expected = XmlListConfig(ElementTree.fromstring(get_payload(case).encode('utf8')))
+            self.assertEqual(expected, list(iter_xml_items(get_payload_path(case))))
+
+    def test_parse_xml_matches_xml_list_config(self):
+        payload = (
+            '<root><item z="9"><n a="1"><b>1</b></n><m a="2"><q>1</q><q>2</q></m><n>x</n><n>y</n><e/></item>'
+            '<item><r><s>1</s></r><r><s>2</s></r></item><t>  </t><t>text</t></root>'
+        )
+        cases = [payload] + [get_payload(case) for case in ('multiple_linked_models.xml', 'raw_events.xml')]
+        for use_lxml in (False, True) if lxml_etree is not None else (False,):
+            for case in cases:
+                expected = XmlListConfig(ElementTree.fromstring(case))
+                parsed = parse_xml(case, use_lxml=use_lxml)
+                self.assertEqual(expected, parsed)
+                self.assertIsInstance(parsed, XmlListConfig)
+                self.assertEqual([type(item) for item in expected], [type(item) for item in parsed])
+
+    def test_parse_xml_skips_unused_keys(self):
+        payload = '<root><item a="1" b="2"><x><y>1</y></x><z>2</z></item><item><r>1</r><r>2</r></item></root>'
+        keys = {'attr_a', 'x'}
+        expected = [{'attr_a': '1', 'x': {'y': '1'}}, ['1', '2']]
+        for use_lxml in (False, True) if lxml_etree is not None else (False,):
+            self.assertEqual(expected, parse_xml(payload, use_lxml=use_lxml, keys=keys))
+        self.assertEqual(expected, list(iter_xml_items(io.BytesIO(payload.encode('utf8')), keys=keys)))
+
+    def test_parse_xml_rejects_external_entities(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'secret.txt')
+        with open(path, 'w') as f:
+            f.write('secret')
+        payload = ('<?xml version="1.0"?><!DOCTYPE root [<!ENTITY secret SYSTEM "file://{}">]>'
+                   '<root><item><name>&secret;</name></item></root>').format(path)
+        for use_lxml in (False, True) if lxml_etree is not None else (False,):
+            with self.assertRaises(SyntaxError):
+                parse_xml(payload, use_lxml=use_lxml)
+        with self.assertRaises(SyntaxError):
+            list(iter_xml_items(io.BytesIO(payload.encode('utf8'))))
+
+    def test_iter_json_items_splits_numbers_at_any_chunk_size(self):
+        document = {'results': [{'id': 1, 'price': 0.25}, {'id': -12, 'price': 1e-3}], 'total': 12.5, 'count': 2}
+        payload = json.dumps(document, separators=(',', ':'))
+        for chunk_size in range(1, len(payload) + 2):
+            self.assertEqual(document['results'], list(iter_json_items(payload, 'results.*', chunk_size=chunk_size)))
+            self.assertEqual([1, -12], list(iter_json_items(payload, 'results.*.id', chunk_size=chunk_size)))
+            self.assertEqual([0.25, 12.5], list(iter_json_items('[0.25,12.5]', chunk_size=chunk_size)))
+
+    def test_iter_json_items(self):
+        document = {'count': 2, 'results': [{'id': 1, 'tags': ['a', 'b']}, {'id': 23456, 'price': 1.5}], 'x': None}
+        payload = json.dumps(document, indent=2)
+        for source in (payload, payload.encode('utf8'), io.StringIO(payload), io.BytesIO(payload.encode('utf8'))):
+            # tiny chunks split the values across reads
+            self.assertEqual(document['results'], list(iter_json_items(source, 'results.*', chunk_size=3)))
+        self.assertEqual([1, 23456], list(iter_json_items(payload, 'results.*.id')))
+        self.assertEqual([], list(iter_json_items('[]')))
+        with self.assertRaises(ValueError):
+            list(iter_json_items('[1, 2'))
+        self.assertEqual([{'a': 1}, [2]], list(iter_json_lines('{"a": 1}\n\n[2]\n')))
+
+
 class MapperTest(TestCase):
     def test_mapper_without_model_raises(self):
         class WithoutMetaMapper(Mapper):
@@ -48,11 +152,11 @@ class MapperTest(TestCase):
         payload = ''
 
         mapper = DummyMapper(payload)
-        self.assertEqual(2000, mapper._formset.max_num)
+        self.assertEqual(2000, mapper.max_items)
 
         with self.settings(KUDAGO_MAPPER_MAX_ITEMS=5000):
             mapper = DummyMapper(payload)
-            self.assertEqual(5000, mapper._formset.max_num)
+            self.assertEqual(5000, mapper.max_items)
 
             class LargeDummyMapper(DummyMapper):
                 class Meta:
@@ -61,10 +165,61 @@ class MapperTest(TestCase):
                     fields = '__all__'
 
             mapper = LargeDummyMapper(payload)
-            self.assertEqual(10000, mapper._formset.max_num)
+            self.assertEqual(10000, mapper.max_items)
+
+    def test_form_class_is_built_once_per_mapper_class(self):
+        payload = get_payload('single_item.xml')
+
+        self.assertIs(HallRSSMapper(payload).form_class, HallRSSMapper(payload).form_class)
+        self.assertIs(HallRSSMapper.get_form_class(), HallRSSMapper(payload).form_class)
+        self.assertIsNot(HallRSSMapper.get_form_class(), SyncHallRSSMapper.get_form_class())
+        self.assertIsNot(EventRSSMapper.get_form_class(), CheapEventRSSMapper.get_form_class())
+        self.assertIn('price_min', CheapEventRSSMapper.get_form_class()().fields)
+
+    def test_forms_are_built_lazily_up_to_max_items(self):
+        consumed = []
+
+        class GeneratorMapper(Mapper):
+            def parse_data(self, data):
+                for i in range(5):
+                    consumed.append(i)
+                    yield {'name': str(i), 'url': 'https://example.com/{}'.format(i)}
+
+            class Meta:
+                model = Hall
+                fields = ('name', 'url')
+                max_items = 3
+
+        mapper = GeneratorMapper('')
+        forms = mapper.iter_forms()
+        self.assertEqual([], consumed)
+
+        self.assertEqual('0', next(forms)['name'].value())
+        self.assertEqual([0], consumed)
+
+        self.assertEqual(['1', '2'], [form['name'].value() for form in forms])
+        self.assertEqual(['0', '1', '2'], [hall.name for hall in GeneratorMapper('').save()])
+
+
+class LinkedModelsMixin(object):
+    def check_linked_multimodel_objects(self):
+        self.assertEqual(3, ArtistThrough.objects.count())
+        self.assertEqual(4, Hall.objects.count())
+        self.assertEqual(3, ActionThrough.objects.count())
+        self.assertEqual(3, EventThrough.objects.count())
+
+        action0, action1 = list(ActionThrough.objects.all()[:2])
+        artist_actions = [(action0, action1,), (action0, action1,), (action1,)]
+        event_actions = [action0, action0, action1]
+        hall0, hall1 = list(Hall.objects.all()[:2])
+        halls = [hall0, hall0, hall1]
+
+        self.assertEqual(artist_actions, [tuple(artist.actions.all()) for artist in ArtistThrough.objects.all()])
+        self.assertEqual(halls, [event.hall for event in EventThrough.objects.all()])
+        self.assertEqual(event_actions, [event.action for event in EventThrough.objects.all()])
 
 
-class RSSMapperTest(TestCase):
+class RSSMapperTest(LinkedModelsMixin, TestCase):
     def create_halls_and_actions(self):
         action0 = Action.objects.create(id=10960, ext_id=10960, name='Original Meet 2017',
                                         url='https://spb.kassir.ru/kassir/action/view/10960')
@@ -105,6 +260,137 @@ class RSSMapperTest(TestCase):
         self.assertEqual(names, list(Hall.objects.values_list('name', flat=True)))
         self.assertEqual(urls, list(Hall.objects.values_list('url', flat=True)))
 
+    def test_streaming_from_path_and_file(self):
+        StreamingHallRSSMapper(get_payload_path('multiple_models.xml')).save()
+        self.assertEqual(4, Hall.objects.count())
+
+        Hall.objects.all().delete()
+        with open(get_payload_path('multiple_models.xml'), 'rb') as f:
+            halls = StreamingHallRSSMapper(f).save()
+        self.assertEqual(set(halls), set(Hall.objects.all()))
+        self.assertEqual(4, len(halls))
+
+    def test_save_chunked(self):
+        class UncappedHallRSSMapper(StreamingHallRSSMapper):
+            class Meta(StreamingHallRSSMapper.Meta):
+                max_items = 1
+
+        path = get_payload_path('multiple_models.xml')
+        self.assertEqual(4, UncappedHallRSSMapper(path).save_chunked(chunk_size=3))
+        self.assertEqual(4, Hall.objects.count())
+        Hall.objects.all().delete()
+        self.assertEqual(4, UncappedHallRSSMapper(path).save_chunked(chunk_size=3, bulk=True))
+        self.assertEqual(4, Hall.objects.count())
+
+        Hall.objects.all().delete()
+        save = Hall.save
+
+        def failing_save(obj, *args, **kwargs):
+            if Hall.objects.count() == 3:
+                raise RuntimeError
+            save(obj, *args, **kwargs)
+
+        with mock.patch.object(Hall, 'save', autospec=True, side_effect=failing_save):
+            with self.assertRaises(RuntimeError):
+                UncappedHallRSSMapper(path).save_chunked(chunk_size=2)
+        # the first chunk is kept, the second one is rolled back
+        self.assertEqual(2, Hall.objects.count())
+
+    def test_json_mappers(self):
+        halls = [{'id': i, 'name': 'Hall {}'.format(i), 'site_url': 'http://example.com/{}'.format(i)}
+                 for i in range(1, 4)]
+        actions = [{'id': 1, 'name': 'Action', 'site_url': 'http://example.com/a', 'category': 'concert'}]
+        payload = json.dumps({'count': 3, 'halls': halls, 'actions': actions})
+
+        objects = HallJSONMapper(io.BytesIO(payload.encode('utf8'))).save()
+        self.assertEqual([1, 2, 3], [hall.ext_id for hall in objects])
+        self.assertEqual('http://example.com/2', Hall.objects.get(ext_id=2).url)
+
+        Hall.objects.all().delete()
+        lines = '\n'.join(json.dumps(hall) for hall in halls)
+        self.assertEqual(3, len(HallJSONLinesMapper(io.StringIO(lines)).save()))
+
+        Hall.objects.all().delete()
+        HallActionJSONMapperComposite(payload).save()
+        self.assertEqual(3, Hall.objects.count())
+        self.assertEqual(['Action'], list(Action.objects.values_list('name', flat=True)))
+
+    def test_sync_of_unchanged_items(self):
+        payload = get_payload('multiple_items.xml')
+        self.assertEqual(4, len(PlainSyncHallRSSMapper(payload).sync().created))
+
+        # the forms of identical items don't change, but their objects are still there
+        result = PlainSyncHallRSSMapper(payload).sync()
+        self.assertEqual(([], [], 4), (result.created, result.updated, len(result.unchanged)))
+
+        class CappedSyncHallRSSMapper(PlainSyncHallRSSMapper):
+            class Meta(PlainSyncHallRSSMapper.Meta):
+                max_items = 3
+
+        # the items past Meta.max_items aren't synced, but they aren't missing either
+        result = CappedSyncHallRSSMapper(payload).sync(delete_missing=True)
+        self.assertEqual((3, []), (len(result.unchanged), result.missing))
+        self.assertEqual(4, Hall.objects.count())
+
+    def test_bulk_save(self):
+        payload = get_payload('multiple_items.xml')
+
+        with CaptureQueriesContext(connection) as ctx:
+            halls = HallRSSMapper(payload).save(bulk=True, batch_size=3)
+
+        inserts = [query for query in ctx.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(2, len(inserts))
+        self.assertEqual(4, len(halls))
+        self.assertEqual([hall.name for hall in halls], list(Hall.objects.values_list('name', flat=True)))
+
+    def test_bulk_save_of_repeated_items(self):
+        payload = repeat_item(get_payload('multiple_items.xml'), 'hall')
+
+        # the repeated hall is left out instead of failing the insert of its batch
+        halls = HallRSSMapper(payload).save(bulk=True, batch_size=3)
+        self.assertEqual(4, len(halls))
+        self.assertEqual(4, Hall.objects.count())
+
+        Hall.objects.all().delete()
+        self.assertEqual(4, HallRSSMapper(payload).save_chunked(bulk=True))
+        self.assertEqual(4, Hall.objects.count())
+
+    def test_bulk_save_with_m2m(self):
+        action0, action1, _, _ = self.create_halls_and_actions()
+
+        payload = get_payload('artists.xml')
+
+        artists = ArtistRSSMapper(payload).save(bulk=True)
+
+        self.assertEqual(3, len(artists))
+        actions = [(action0, action1,), (action0, action1,), (action0, action1)]
+        self.assertEqual(actions, [tuple(artist.actions.all()) for artist in Artist.objects.all()])
+
+    def test_sync(self):
+        _, _, hall0, hall1 = self.create_halls_and_actions()
+        Hall.objects.filter(pk=hall1.pk).update(name='Old name')
+        gone = Hall.objects.create(ext_id=5, name='Closed', url='https://spb.kassir.ru/kassir/hall/view/5')
+
+        payload = get_payload('multiple_items.xml')
+
+        with self.assertRaises(ValueError):
+            HallRSSMapper(payload).sync()
+
+        result = SyncHallRSSMapper(payload).sync()
+
+        self.assertEqual([1022, 1061], [hall.ext_id for hall in result.created])
+        self.assertEqual([hall1], result.updated)
+        self.assertEqual([hall0], result.unchanged)
+        self.assertEqual([5], result.missing)
+        self.assertEqual('ДК Выборгский', Hall.objects.get(ext_id=1099).name)
+        self.assertEqual(5, Hall.objects.count())
+
+        result = SyncHallRSSMapper(payload).sync(delete_missing=True)
+
+        self.assertEqual(([], [], [5]), (result.created, result.updated, result.missing))
+        self.assertEqual(4, len(result.unchanged))
+        self.assertFalse(Hall.objects.filter(pk=gone.pk).exists())
+
     def test_create_with_date_decimal_foreign(self):
         _, _, hall0, hall1 = self.create_halls_and_actions()
 
@@ -121,6 +407,69 @@ class RSSMapperTest(TestCase):
         self.assertEqual(prices, list(Event.objects.values_list('price_max', flat=True)))
         self.assertEqual(halls, [event.hall for event in Event.objects.all()])
 
+    def test_csv_mapper_converts_columns(self):
+        self.create_halls_and_actions()
+        rows = [
+            'id;name;category;url;start_date;end_date;price_min;price_max;hall_id;action_id;extra',
+            '1;First;concert;https://example.com/1;10.09.2017 13:00;10.09.2017 15:00;400;1200.50;310712;10960;x',
+            '2;Second;concert;https://example.com/2;10.09.2017 13:00;10.09.2017 15:00;400;free;1099;13985;x',
+            '3;Third;concert;https://example.com/3;11.09.2017 19:00;11.09.2017 21:00;100;400;1099;13985',
+        ]
+        payload = '\r\n'.join(rows).encode('utf8')
+
+        mapper = EventCSVMapper(io.BytesIO(payload))
+        self.assertEqual({'start_date', 'end_date', 'price_min', 'price_max', 'ext_id'},
+                         set(mapper.get_column_fields()))
+        with mock.patch.object(forms.DecimalField, 'clean', autospec=True,
+                               side_effect=forms.DecimalField.clean) as clean:
+            events = mapper.save()
+        # only the invalid price goes through the field
+        self.assertEqual(1, clean.call_count)
+
+        self.assertEqual([1, 3], [event.ext_id for event in events])
+        self.assertEqual([datetime.datetime(2017, 9, 10, 13), datetime.datetime(2017, 9, 11, 19)],
+                         list(Event.objects.values_list('start_date', flat=True)))
+        self.assertEqual([Decimal('1200.50'), Decimal(400)], list(Event.objects.values_list('price_max', flat=True)))
+
+    def test_related_objects_are_fetched_once_per_field(self):
+        self.create_halls_and_actions()
+
+        payload = get_payload('events.xml')
+
+        with CaptureQueriesContext(connection) as ctx:
+            events = EventRSSMapper(payload).save()
+
+        selects = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(3, len(events))
+        self.assertEqual(1, len([sql for sql in selects if 'FROM "tests_hall"' in sql]))
+        self.assertEqual(1, len([sql for sql in selects if 'FROM "tests_action"' in sql]))
+
+        with CaptureQueriesContext(connection) as ctx:
+            ArtistRSSMapper(get_payload('artists.xml')).save()
+
+        # m2m saving joins the action table as well
+        selects = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(1, len([sql for sql in selects if 'FROM "tests_action" WHERE' in sql]))
+
+    def test_prefetched_queryset(self):
+        _, _, hall0, hall1 = self.create_halls_and_actions()
+
+        queryset = PrefetchedQuerySet.prefetch(Hall.objects.all(), 'ext_id', ['310712', '5', 'invalid']).all()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(hall0, queryset.get(ext_id='310712'))
+            self.assertEqual([hall0], list(queryset.filter(ext_id__in=['310712', 5])))
+            with self.assertRaises(Hall.DoesNotExist):
+                queryset.get(ext_id=5)
+            with self.assertRaises(ValueError):
+                queryset.get(ext_id='invalid')
+
+        # values which weren't prefetched are looked up in the database
+        with self.assertNumQueries(1):
+            self.assertEqual(hall1, queryset.get(ext_id=1099))
+        with self.assertNumQueries(1):
+            self.assertEqual([hall1], list(queryset.filter(name='ДК Выборгский')))
+
     def test_create_with_m2m(self):
         action0, action1, _, _ = self.create_halls_and_actions()
 
@@ -147,6 +496,24 @@ class RSSMapperTest(TestCase):
         self.assertEqual(actions, [tuple(artist.actions.all()) for artist in ArtistThrough.objects.all()])
         self.assertEqual(ext_ids, list(ArtistThrough.objects.values_list('ext_id', flat=True)))
 
+    def test_through_links_are_saved_in_bulk(self):
+        action0 = ActionThrough.objects.create(id=10960, ext_id=10960, name='Original Meet 2017',
+                                               url='https://spb.kassir.ru/kassir/action/view/10960')
+        action1 = ActionThrough.objects.create(id=13985, ext_id=13985, name='Балет на льду "Вечер балета"',
+                                               url='https://spb.kassir.ru/kassir/action/view/13985')
+
+        payload = get_payload('artists2.xml')
+
+        with CaptureQueriesContext(connection) as ctx:
+            ArtistThroughRSSMapper(payload).save(bulk=True)
+
+        inserts = [query['sql'] for query in ctx.captured_queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(2, len(inserts))
+        self.assertEqual(1, len([sql for sql in inserts if 'INTO "tests_artisttoaction"' in sql]))
+
+        actions = [(action0, action1,), (action0, action1,), (action1,)]
+        self.assertEqual(actions, [tuple(artist.actions.all()) for artist in ArtistThrough.objects.all()])
+
     def test_single_field_transforms(self):
         self.create_halls_and_actions()
 
@@ -169,6 +536,31 @@ class RSSMapperTest(TestCase):
         self.assertEqual(prices, list(Event.objects.values_list('price_min', 'price_max')))
         self.assertEqual(names, list(Event.objects.values_list('name', flat=True)))
 
+    def test_cached_fields(self):
+        self.create_halls_and_actions()
+
+        mapper = CachedEventTransfRSSMapper(get_payload('raw_events.xml'))
+        with mock.patch.object(RubleField, 'clean', autospec=True, side_effect=RubleField.clean) as clean:
+            mapper.save()
+        # the repeated prices of the first two events are cleaned once
+        self.assertEqual(4, clean.call_count)
+        self.assertEqual([(Decimal('400.1'), Decimal('400.2')), (Decimal('400.1'), Decimal('400.2')),
+                          (Decimal(500), Decimal(1200))],
+                         list(Event.objects.values_list('price_min', 'price_max')))
+
+        stats = mapper.get_cache_stats()
+        self.assertEqual(['price_min', 'price_max', 'start_date'], list(stats))
+        self.assertEqual((1, 2, 2, 2), stats['price_min'][:4])
+        self.assertAlmostEqual(1 / 3, stats['price_min'].hit_rate)
+        self.assertEqual(0, stats['start_date'].hits)
+
+        class RelatedCacheMapper(CachedEventTransfRSSMapper):
+            class Meta(CachedEventTransfRSSMapper.Meta):
+                cache_fields = ('hall',)
+
+        with self.assertRaises(ValueError):
+            RelatedCacheMapper(get_payload('raw_events.xml'))
+
     def test_multiple_field_transforms(self):
         self.create_halls_and_actions()
 
@@ -191,6 +583,157 @@ class RSSMapperTest(TestCase):
         self.assertEqual(durations, list(Event.objects.values_list('duration', flat=True)))
         self.assertEqual(ages, list(Event.objects.values_list('age_min', 'age_max')))
 
+    def test_transform_output_fields_are_compiled_once(self):
+        self.create_halls_and_actions()
+
+        form_class = EventTransfMultipleRSSMapper.get_form_class()
+        # TimesToDurationTransform doesn't declare its output, so any model field is allowed
+        fields = ('url', 'start_date', 'hall', 'ext_id', 'end_date', 'name', 'action', 'price_min', 'price_max',
+                  'category', 'duration', 'age_max', 'age_min')
+        self.assertEqual(fields, form_class._meta.fields)
+        self.assertEqual(('age_min', 'age_max'),
+                         EventTransfMultipleRSSMapper.declared_transforms['age_range_transform'].output_fields)
+
+        EventTransfMultipleRSSMapper(get_payload('raw_events.xml')).save()
+
+        self.assertEqual(fields, form_class._meta.fields)
+        self.assertEqual(3, Event.objects.count())
+
+    def test_stats(self):
+        self.create_halls_and_actions()
+        emitted = []
+
+        class InstrumentedMapper(EventTransfMultipleRSSMapper):
+            class Meta(EventTransfMultipleRSSMapper.Meta):
+                stats_hook = emitted.append
+
+        mapper = InstrumentedMapper(get_payload('raw_events.xml'))
+        with CaptureQueriesContext(connection) as queries:
+            mapper.save()
+
+        stats = mapper.stats
+        self.assertEqual([stats], emitted)
+        self.assertEqual({'parsed': 3, 'valid': 3, 'invalid': 0, 'saved': 3}, dict(stats.counters))
+        self.assertEqual(len(queries), stats.queries)
+        self.assertTrue(all(stats.timings[stage] > 0 for stage in ('parse', 'prefetch', 'validate', 'write')))
+        self.assertGreaterEqual(stats.timings['total'], stats.timings['validate'] + stats.timings['write'])
+        self.assertIn('price_min', stats.field_times)
+        self.assertEqual(['ttd_transform', 'age_range_transform', 'categories_transform'],
+                         list(stats.transform_times))
+        self.assertEqual(3, stats.as_dict()['counters.saved'])
+
+        self.assertIsNone(EventTransfMultipleRSSMapper(get_payload('raw_events.xml')).stats)
+
+    def test_transforms_are_applied_in_batches(self):
+        self.create_halls_and_actions()
+        rows = [{'age_range': '18-25', 'category1': 'a', 'category2': 'b', 'category3': 'c'},
+                {'age_range': '35-60', 'category1': 'd', 'category2': 'e', 'category3': 'f'}]
+        split = SplitMapperTransform(from_field='age_range', to_fields=('age_min', 'age_max'), sep='-')
+        stack = StackMapperTransform(from_fields=('category1', 'category2', 'category3'), to_field='category')
+        int_split = IntSplitTransform(from_field='age_range', to_fields=('age_min', 'age_max'), sep='-')
+        for transform in (split, stack, int_split):
+            self.assertEqual([transform(**row) for row in rows], transform.apply_batch(rows))
+
+        with mock.patch.object(StackMapperTransform, '__call__') as call, \
+                mock.patch.object(StackMapperTransform, 'apply_batch', autospec=True,
+                                  side_effect=StackMapperTransform.apply_batch) as apply_batch:
+            forms = list(EventTransfMultipleRSSMapper(get_payload('raw_events.xml')).iter_forms())
+        # the forms are validated ahead, with a single call for the batch
+        self.assertEqual(1, apply_batch.call_count)
+        self.assertFalse(call.called)
+        self.assertEqual([(18, 25), (18, 25), (35, 60)],
+                         [(form.cleaned_data['age_min'], form.cleaned_data['age_max']) for form in forms])
+
+    def test_cleaning_in_processes(self):
+        self.create_halls_and_actions()
+        mapper = ProcessesEventTransfMultipleRSSMapper(get_payload('raw_events.xml'))
+        # the split and stack transforms take all the fields, so only the duration one runs in the workers
+        self.assertEqual(1, ProcessesEventTransfMultipleRSSMapper.get_form_class().worker_transforms)
+
+        mapper.save()
+
+        self.assertEqual(['фестивали,музыкальные фестивали,фестивали на открытом воздухе',
+                          'фестивали,музыкальные фестивали,фестивали на открытом воздухе',
+                          'театр,балет / танец,другое'],
+                         list(Event.objects.values_list('category', flat=True)))
+        self.assertEqual([datetime.timedelta(hours=7), datetime.timedelta(hours=8), datetime.timedelta(minutes=1)],
+                         list(Event.objects.values_list('duration', flat=True)))
+        self.assertEqual([(18, 25), (18, 25), (35, 60)], list(Event.objects.values_list('age_min', 'age_max')))
+
+        Event.objects.all().delete()
+        # the worker processes are started once for all the chunks
+        with mock.patch('kudago_mapper.mappers.ProcessPoolExecutor', wraps=ProcessPoolExecutor) as executor:
+            self.assertEqual(3, ProcessesEventTransfMultipleRSSMapper(get_payload('raw_events.xml'))
+                             .save_chunked(chunk_size=1))
+        self.assertEqual(1, executor.call_count)
+        self.assertEqual(3, Event.objects.count())
+
+        Event.objects.all().delete()
+        # the invalid items get the same errors as when cleaned in the current process
+        errors = [form.errors for form in ProcessesCheapEventRSSMapper(get_payload('events.xml')).iter_forms()]
+        self.assertIn('price_min', errors[2])
+        self.assertEqual([form.errors for form in CheapEventRSSMapper(get_payload('events.xml')).iter_forms()], errors)
+        ProcessesCheapEventRSSMapper(get_payload('events.xml')).save()
+        self.assertEqual([Decimal(400), Decimal(400)], list(Event.objects.values_list('price_max', flat=True)))
+
+    def test_parse_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        payload = get_payload('multiple_models.xml')
+
+        with override_settings(KUDAGO_MAPPER_PARSE_CACHE=ParseCache(directory)), \
+                mock.patch('kudago_mapper.mappers.parse_xml', wraps=parse_xml) as parse:
+            HallRSSMapper(payload).save()
+            # the mappers share the items, whatever keys they use
+            actions = ActionThroughRSSMapper(payload)
+        self.assertEqual(1, parse.call_count)
+        self.assertEqual(parse_xml(payload), actions.data)
+        actions.save()
+        self.assertEqual(4, Hall.objects.count())
+        self.assertEqual(3, ActionThrough.objects.count())
+
+        # the entry doesn't fit, so it is evicted at once
+        cache = ParseCache(directory, max_size=100)
+        cache.clear()
+        with override_settings(KUDAGO_MAPPER_PARSE_CACHE=cache), \
+                mock.patch('kudago_mapper.mappers.parse_xml', wraps=parse_xml) as parse:
+            HallRSSMapper(payload)
+            HallRSSMapper(payload)
+        self.assertEqual(2, parse.call_count)
+        self.assertEqual([], os.listdir(directory))
+
+        # a path isn't a payload, the file behind it may change
+        path = os.path.join(directory, 'feed.xml')
+        with override_settings(KUDAGO_MAPPER_PARSE_CACHE=ParseCache(directory)):
+            for name in ('Old', 'New'):
+                with open(path, 'w', encoding='utf8') as f:
+                    f.write(payload.replace('ДК Выборгский', name))
+                self.assertIn(name, [item['name'] for item in StreamingHallRSSMapper(path).iter_items()])
+        self.assertEqual(['feed.xml'], os.listdir(directory))
+
+    def test_error_report(self):
+        self.create_halls_and_actions()
+        payload = get_payload('events.xml')
+
+        self.assertEqual([ItemError(2, '103270', 'price_min', 'Ensure this value is less than or equal to 400.')],
+                         list(CheapEventRSSMapper(payload).iter_errors()))
+        with self.assertRaises(InvalidItemsError) as raised:
+            CheapEventRSSMapper(payload).save(raise_invalid=True)
+        self.assertTrue(raised.exception.complete)
+        self.assertEqual([2], [error.index for error in raised.exception.errors])
+        self.assertEqual(0, Event.objects.count())
+
+        # the items which aren't halls are invalid, the validation stops at the first one
+        Hall.objects.all().delete()
+        mapper = SyncHallRSSMapper(get_payload('multiple_models.xml'))
+        with mock.patch.object(mapper.form_class, 'full_clean', autospec=True,
+                               side_effect=mapper.form_class.full_clean) as full_clean:
+            with self.assertRaises(ValueError) as raised:
+                mapper.save(raise_invalid=True, max_errors=1)
+        self.assertFalse(raised.exception.complete)
+        self.assertEqual([ItemError(4, '10960', 'type_', 'Check failed.')], raised.exception.errors)
+        self.assertEqual(5, full_clean.call_count)
+
     def test_filtering_by_validation(self):
         _, _, hall0, _ = self.create_halls_and_actions()
 
@@ -219,18 +762,216 @@ class RSSMapperTest(TestCase):
         payload = get_payload('multiple_linked_models.xml')
 
         KassirMapperComposite(payload).save()
+        self.check_linked_multimodel_objects()
 
-        self.assertEqual(3, ArtistThrough.objects.count())
+    def test_linked_multimodel_input_bulk(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        KassirMapperComposite(payload).save(bulk=True)
+        self.check_linked_multimodel_objects()
+
+
+class MapperCompositeTest(LinkedModelsMixin, TransactionTestCase):
+    def test_payload_is_parsed_once(self):
+        with mock.patch('kudago_mapper.mappers.parse_xml', wraps=parse_xml) as parse:
+            KassirMapperComposite(get_payload('multiple_linked_models.xml'))
+
+        self.assertEqual(1, parse.call_count)
+
+    def test_items_are_routed_by_discriminator(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        composite = KassirMapperComposite(payload)
+
+        self.assertEqual([4, 3, 3, 3], [len(mapper.data) for mapper in composite.mappers[:2]] +
+                         [len(list(mapper.iter_items())) for mapper in composite.mappers[2:]])
+        self.assertEqual(['hall'] * 4, [item['type'] for item in composite.mappers[0].data])
+        # the artist mapper checks its items itself
+        self.assertEqual(13, len(composite.mappers[2].data))
+
+        self.assertEqual(4, len(list(HallRSSMapper(payload).iter_forms())))
+
+    def test_parsing_is_projected_on_source_keys(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        hall_keys = HallRSSMapper.get_source_keys()
+        self.assertIn('type', hall_keys)
+        self.assertTrue(all(set(item) <= hall_keys for item in HallRSSMapper(payload).data))
+
+        composite = KassirMapperComposite(payload)
+        keys = frozenset().union(*(type(mapper).get_source_keys() for mapper in composite.mappers))
+        self.assertEqual(keys, composite.mappers[0].source_keys)
+        composite.save()
+        self.check_linked_multimodel_objects()
+
+    def test_stats(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        with override_settings(KUDAGO_MAPPER_STATS=True):
+            composite = KassirMapperComposite(payload)
+            composite.save()
+        # the items are parsed once and shared, the artist mapper checking them itself
+        self.assertEqual(len(parse_xml(payload)), composite.get_stats().counters['parsed'])
+        self.assertEqual(len(parse_xml(payload)), composite.mappers[0].stats.counters['parsed'])
+        self.check_linked_multimodel_objects()
+
+    def test_concurrent_validation(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        composite = ParallelKassirMapperComposite(payload)
+        self.assertEqual([[HallRSSMapper, ActionThroughRSSMapper], [ArtistThroughRSSMapper, EventThroughRSSMapper]],
+                         [[type(mapper) for mapper in stage] for stage in composite.stages])
+
+        composite.save()
+        self.check_linked_multimodel_objects()
+
+        # the stages are only validated concurrently with Meta.workers
+        with mock.patch('kudago_mapper.mappers.ThreadPoolExecutor') as executor:
+            HallActionMapperComposite(get_payload('multiple_models.xml')).save()
+        self.assertFalse(executor.called)
+
+    def test_concurrent_validation_of_repeated_items(self):
+        payload = repeat_item(repeat_item(get_payload('multiple_linked_models.xml'), 'hall'), 'artist')
+
+        # the stages are validated ahead of their save, so the repeated items are only caught among the forms
+        ParallelKassirMapperComposite(payload).save()
+        self.check_linked_multimodel_objects()
+
+    def test_stages_follow_model_dependencies(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        composite = ReversedKassirMapperComposite(payload)
+        self.assertEqual([[ActionThroughRSSMapper, HallRSSMapper], [EventThroughRSSMapper, ArtistThroughRSSMapper]],
+                         [[type(mapper) for mapper in stage] for stage in composite.stages])
+
+        composite.save()
+        self.check_linked_multimodel_objects()
+
+    def test_flat_composite_with_repeated_items(self):
+        payload = get_payload('multiple_models.xml')
+
+        class ParallelHallActionMapperComposite(HallActionMapperComposite):
+            class Meta(HallActionMapperComposite.Meta):
+                workers = 2
+
+        # the independent mappers of a flat composite end up in a stage, validated concurrently with Meta.workers
+        composite = ParallelHallActionMapperComposite(repeat_item(payload, 'hall'))
+        self.assertEqual([[HallRSSMapper, ActionThroughRSSMapper]],
+                         [[type(mapper) for mapper in stage] for stage in composite.stages])
+        composite.save()
         self.assertEqual(4, Hall.objects.count())
         self.assertEqual(3, ActionThrough.objects.count())
-        self.assertEqual(3, EventThrough.objects.count())
 
-        action0, action1 = list(ActionThrough.objects.all()[:2])
-        artist_actions = [(action0, action1,), (action0, action1,), (action1,)]
-        event_actions = [action0, action0, action1]
-        hall0, hall1 = list(Hall.objects.all()[:2])
-        halls = [hall0, hall0, hall1]
+        KassirMapperComposite(repeat_item(get_payload('multiple_linked_models.xml'), 'event')).save()
+        self.check_linked_multimodel_objects()
 
-        self.assertEqual(artist_actions, [tuple(artist.actions.all()) for artist in ArtistThrough.objects.all()])
-        self.assertEqual(halls, [event.hall for event in EventThrough.objects.all()])
-        self.assertEqual(event_actions, [event.action for event in EventThrough.objects.all()])
+    def test_stages_of_mappers_of_same_model(self):
+        composite = HallsMapperComposite(get_payload('multiple_models.xml'))
+        # the second mapper checks its objects against the ones saved by the first one
+        self.assertEqual([[HallRSSMapper], [SyncHallRSSMapper]],
+                         [[type(mapper) for mapper in stage] for stage in composite.stages])
+        composite.save()
+        self.assertEqual(4, Hall.objects.count())
+
+    def test_circular_dependency(self):
+        related_models = {Hall: {Action}, Action: {Hall}}
+        with mock.patch('kudago_mapper.utils.get_related_models', side_effect=related_models.get):
+            with self.assertRaises(ValueError):
+                HallActionJSONMapperComposite(json.dumps({'halls': [], 'actions': []}))
+
+    def test_stages_are_validated_sequentially_inside_transaction(self):
+        payload = get_payload('multiple_linked_models.xml')
+
+        with transaction.atomic():
+            ReversedKassirMapperComposite(payload).save(bulk=True)
+
+        self.check_linked_multimodel_objects()
+
+
+class ChangeDetectionTest(TransactionTestCase):
+    def test_unchanged_items_are_skipped(self):
+        payload = get_payload('multiple_models.xml')
+
+        mapper = HashedHallRSSMapper(payload)
+        self.assertEqual(4, len(mapper.sync().created))
+        self.assertEqual(4, ItemHash.objects.filter(namespace=HashedHallRSSMapper.get_hash_namespace()).count())
+
+        # the skipped items are neither validated nor taken as missing
+        mapper = HashedHallRSSMapper(payload)
+        self.assertEqual(SyncResult([], [], [], []), mapper.sync(delete_missing=True))
+        # only the items which aren't halls are validated again, as they were invalid
+        self.assertEqual({'parsed': 7, 'skipped': 4, 'valid': 0, 'invalid': 3, 'saved': 0},
+                         dict(mapper.stats.counters))
+        self.assertEqual(4, Hall.objects.count())
+
+        result = HashedHallRSSMapper(payload.replace('ДК Выборгский (Малый зал)', 'Малый зал')).sync()
+        self.assertEqual(['Малый зал'], [hall.name for hall in result.updated])
+
+    def test_file_hash_store(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        store = FileHashStore(directory)
+        store.set_many('halls', {'1': item_hash({'name': 'a', 'ext_id': '1'}), '2': 'b'})
+        self.assertEqual(item_hash({'ext_id': '1', 'name': 'a'}), store.get_many('halls', ['1', '3'])['1'])
+
+        store = FileHashStore(directory)
+        self.assertEqual({'2': 'b'}, store.get_many('halls', ['2']))
+        store.clear('halls')
+        self.assertEqual({}, FileHashStore(directory).get_many('halls', ['1', '2']))
+
+
+class SourceTest(LinkedModelsMixin, TransactionTestCase):
+    def setUp(self):
+        handler = partial(SimpleHTTPRequestHandler, directory=get_payload_path(''))
+        # silence the request log
+        handler.log_message = lambda *args: None
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def get_url(self, case):
+        return 'http://127.0.0.1:{}/{}'.format(self.server.server_address[1], case)
+
+    def test_from_source(self):
+        composite = self.loop.run_until_complete(
+            KassirMapperComposite.afrom_source(self.get_url('multiple_linked_models.xml')))
+        self.loop.run_until_complete(composite.asave(bulk=True))
+        self.check_linked_multimodel_objects()
+
+        with open(get_payload_path('multiple_models.xml'), 'rb') as f:
+            mapper = self.loop.run_until_complete(StreamingHallRSSMapper.afrom_source(f))
+        self.assertEqual(7, len(list(mapper.iter_items())))
+
+    def test_save_of_repeated_items(self):
+        mapper = HallRSSMapper(repeat_item(get_payload('multiple_models.xml'), 'hall'))
+        self.assertEqual(4, len(self.loop.run_until_complete(mapper.asave())))
+        self.assertEqual(4, Hall.objects.count())
+
+    def test_many_sources_with_bounded_concurrency(self):
+        running = []
+        peak = []
+
+        async def fetcher(source):
+            running.append(source)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            payload = await fetch_source(self.get_url(source))
+            running.remove(source)
+            return payload
+
+        sources = ['multiple_models.xml', 'multiple_linked_models.xml', 'multiple_models.xml', 'missing.xml']
+        results = self.loop.run_until_complete(
+            amap_sources(HallRSSMapper, sources, concurrency=2, fetcher=fetcher, return_exceptions=True))
+
+        self.assertEqual(2, max(peak))
+        # the same halls are in both feeds, so they are only created once
+        self.assertEqual([0, 0, 4], sorted(len(result) for result in results[:3]))
+        self.assertIsInstance(results[3], HTTPError)
+        self.assertEqual(4, Hall.objects.count())